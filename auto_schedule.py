@@ -45,12 +45,12 @@ def commit_and_push_if_changed():
 
 
 def main():
-    print("🚀 Running wallpaper bot once...")
+    print("🚀 Running due wallpaper jobs once...")
 
     old_hash = file_hash("wallpapers.json")
 
     # Run bot
-    result = subprocess.run([sys.executable, "bot.py"], check=False)
+    result = subprocess.run([sys.executable, "bot.py", "--once"], check=False)
     print(f"Bot exited with code {result.returncode}")
 
     # Compare file hash to detect changes
@@ -68,7 +68,7 @@ def main():
         print(f"🕒 Delay ≤ 10 min ({delay}s). Sleeping until next run...")
         time.sleep(delay)
         print("🔁 Restarting bot automatically...")
-        subprocess.run([sys.executable, "bot.py"], check=False)
+        subprocess.run([sys.executable, "bot.py", "--once"], check=False)
         commit_and_push_if_changed()
     else:
         print(f"🕓 Delay > 10 min. Triggering next GitHub Action run in {delay} seconds...")
@@ -0,0 +1,82 @@
+"""Peak memory of checking a wallpapers export, old jsonchk vs wallpapers_io.
+
+Compares jsonchk's old json.load of a whole JSON array with the streaming
+validator (which import uses too) on the same file, plain and gzipped.
+
+    python benchmarks/bench_export_import.py --docs 100000
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import wallpapers_io  # noqa: E402
+
+
+def make_doc(i):
+    rng = random.Random(i)
+    return {
+        "category": rng.choice(["anime", "cars", "nature", "space"]),
+        "wallpaper_url": f"https://4kwallpapers.com/anime/wallpaper-{i}.html",
+        "image_url": f"https://4kwallpapers.com/images/wallpapers/wallpaper-{i}-3840x2160-{i}.jpg",
+        "tags": [f"tag{rng.randint(0, 500)}" for _ in range(rng.randint(3, 12))],
+        "status": "pending",
+        "rand": rng.random(),
+    }
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def old_jsonchk(path):
+    with open(path) as f:
+        data = json.load(f)
+    return len(data)
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        array_path = os.path.join(tmp, "wallpapers.json")
+        with open(array_path, "w") as f:
+            f.write("[\n")
+            for i in range(args.docs):
+                f.write(("," if i else "") + json.dumps(make_doc(i)) + "\n")
+            f.write("]\n")
+        print(f"{args.docs} documents, {os.path.getsize(array_path) / 1024 / 1024:.1f} MB JSON array")
+
+        gz_path = array_path + ".gz"
+        with open(array_path, "rb") as src, gzip.open(gz_path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        for label, fn in [
+            ("json.load (old jsonchk)", lambda: old_jsonchk(array_path)),
+            ("streaming validate", lambda: wallpapers_io.validate(array_path)[0]),
+            ("streaming validate .gz", lambda: wallpapers_io.validate(gz_path)[0]),
+        ]:
+            count, elapsed, peak = measure(fn)
+            print(f"{label:>24}: {count} docs in {elapsed:.2f}s, peak {peak:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Per-image hashing latency: the old inline path vs. the current one.
+
+old: read the saved file back for SHA-256, then average_hash on a full decode,
+     all of it on the event loop.
+new: SHA-256 fed from the download chunks, average_hash on a JPEG draft
+     decode in bot.HASH_EXECUTOR; the loop only pays for the chunk hashing.
+
+    python benchmarks/bench_hashing.py --width 3840 --height 2160 --runs 5
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import imagehash  # noqa: E402
+from PIL import Image, ImageDraw, ImageFilter  # noqa: E402
+
+import bot  # noqa: E402
+
+
+def make_jpeg(path, width, height):
+    # Mandelbrot structure plus sensor-like noise, so the file is photo-sized (MBs).
+    img = Image.effect_mandelbrot((width, height), (-2.2, -1.2, 1.0, 1.2), 80).convert("RGB")
+    ImageDraw.Draw(img).ellipse((width // 4, height // 4, width // 2, height // 2), fill=(200, 80, 40))
+    img = img.filter(ImageFilter.GaussianBlur(2))
+    noise = Image.merge("RGB", [Image.effect_noise((width, height), 40) for _ in range(3)])
+    Image.blend(img, noise, 0.25).save(path, quality=95)
+
+
+def old_hashes(path):
+    sha256_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(4096), b""):
+            sha256_hash.update(block)
+    return sha256_hash.hexdigest(), str(imagehash.average_hash(Image.open(path)))
+
+
+async def new_hashes(path, data):
+    # What download_image does per chunk, followed by the offloaded phash.
+    start = time.perf_counter()
+    sha256_hash = hashlib.sha256()
+    for i in range(0, len(data), bot.DOWNLOAD_CHUNK_SIZE):
+        sha256_hash.update(data[i:i + bot.DOWNLOAD_CHUNK_SIZE])
+    on_loop = time.perf_counter() - start
+    phash = await bot.calculate_phash(path)
+    return sha256_hash.hexdigest(), phash, on_loop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "wall.jpg")
+        make_jpeg(path, args.width, args.height)
+        with open(path, "rb") as f:
+            data = f.read()
+
+        old_times, new_times, new_loop_times = [], [], []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            old_sha, old_phash = old_hashes(path)
+            old_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            new_sha, new_phash, on_loop = asyncio.run(new_hashes(path, data))
+            new_times.append(time.perf_counter() - start)
+            new_loop_times.append(on_loop)
+
+    assert old_sha == new_sha
+    print(json.dumps({
+        "image": f"{args.width}x{args.height}",
+        "bytes": len(data),
+        "old_ms": round(statistics.median(old_times) * 1000, 1),
+        "new_ms": round(statistics.median(new_times) * 1000, 1),
+        "old_loop_blocked_ms": round(statistics.median(old_times) * 1000, 1),
+        "new_loop_blocked_ms": round(statistics.median(new_loop_times) * 1000, 1),
+        "phash_distance": int(imagehash.hex_to_hash(old_phash) - imagehash.hex_to_hash(new_phash)),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Measure re-crawl cost with scraper.py's on-disk HTTP cache.
+
+Crawls the same pages of a local fake site three times with one cache file:
+cold (empty cache), warm (detail pages served from cache, listings revalidated)
+and warm with a zero detail TTL (every page revalidated with If-None-Match).
+
+    python benchmarks/bench_http_cache.py --pages 20 --latency 0.02
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_site  # noqa: E402
+import scraper  # noqa: E402
+from http_cache import HttpCache  # noqa: E402
+
+
+def crawl_pages(pages, engine):
+    page_nums = list(range(1, pages + 1))
+    docs = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(0, len(page_nums), scraper.MAX_PAGE_WORKERS):
+            docs.extend(engine(page_nums[i:i + scraper.MAX_PAGE_WORKERS]))
+    return docs
+
+
+def run(label, pages, handler, engine):
+    served, not_modified = handler.requests_served, handler.not_modified
+    start = time.perf_counter()
+    docs = crawl_pages(pages, engine)
+    elapsed = time.perf_counter() - start
+    canonical = json.dumps(sorted(docs, key=lambda d: d["wallpaper_url"]), sort_keys=True)
+    return {
+        "run": label,
+        "documents": len(docs),
+        "seconds": round(elapsed, 3),
+        "requests": handler.requests_served - served,
+        "not_modified": handler.not_modified - not_modified,
+        "digest": hashlib.sha256(canonical.encode()).hexdigest(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="server-side delay per request (s)")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads")
+    args = parser.parse_args()
+
+    server, base_url = fake_site.start_server(latency=args.latency)
+    handler = server.RequestHandlerClass
+    scraper.BASE_URL = base_url
+    async_engine = scraper.AsyncEngine() if args.engine == "async" else None
+    engine = async_engine.crawl_batch if async_engine else scraper.crawl_batch
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        scraper.CACHE = HttpCache(os.path.join(tmp, "cache.sqlite3"))
+        try:
+            results.append(run("cold", args.pages, handler, engine))
+            results.append(run("warm", args.pages, handler, engine))
+            scraper.CACHE_DETAIL_TTL = 0
+            results.append(run("revalidate", args.pages, handler, engine))
+            path = scraper.CACHE.path
+            size_kb = sum(os.path.getsize(f) for f in (path, path + "-wal") if os.path.exists(f)) / 1024
+        finally:
+            scraper.CACHE.close()
+            if async_engine:
+                async_engine.close()
+            server.shutdown()
+
+    for r in results:
+        print(f"{r['run']:>10}: {r['documents']} docs in {r['seconds']}s, "
+              f"{r['requests']} requests ({r['not_modified']} not modified)")
+    print(f"Cache file: {size_kb:.0f} KB")
+    same = len({r["digest"] for r in results}) == 1
+    print("Documents identical across runs:", "yes" if same else "NO")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Near-duplicate phash lookup: multi-index and packed numpy array vs. the old linear scan.
+
+The linear scan mirrors what check_image_hashes_in_data used to do per post
+(imagehash.hex_to_hash + subtraction over every stored hash), minus the Mongo
+cursor; it is only timed on a few queries because it is so slow at 1M.
+
+    python benchmarks/bench_phash_index.py --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import imagehash  # noqa: E402
+
+from phash_index import MultiIndexHashIndex, PackedHashArray  # noqa: E402
+
+THRESHOLD = 5
+
+
+def random_hashes(n, rng):
+    return [f"{rng.getrandbits(64):016x}" for _ in range(n)]
+
+
+def near(hex_hash, bits, rng):
+    value = int(hex_hash, 16)
+    for b in rng.sample(range(64), bits):
+        value ^= 1 << b
+    return f"{value:016x}"
+
+
+def linear_scan(stored, query):
+    new_hash = imagehash.hex_to_hash(query)
+    for item in stored:
+        if new_hash - imagehash.hex_to_hash(item) < THRESHOLD:
+            return True
+    return False
+
+
+def bench_size(n, queries, scan_queries, rng):
+    stored = random_hashes(n, rng)
+    # Half the queries are near-duplicates of something stored, half are new images.
+    qs = [near(rng.choice(stored), rng.randint(0, 6), rng) for _ in range(queries // 2)]
+    qs += random_hashes(queries - len(qs), rng)
+
+    start = time.perf_counter()
+    index = MultiIndexHashIndex(THRESHOLD - 1)
+    for h in stored:
+        index.add_hex(h)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hits = [index.find_within(int(q, 16)) is not None for q in qs]
+    per_query_index = (time.perf_counter() - start) / len(qs)
+
+    packed = PackedHashArray(THRESHOLD - 1)
+    for h in stored:
+        packed.add_hex(h)
+    start = time.perf_counter()
+    packed_hits = [packed.find_within(int(q, 16)) is not None for q in qs]
+    per_query_packed = (time.perf_counter() - start) / len(qs)
+    assert packed_hits == hits, "packed array and index disagree"
+
+    # Misses are the worst case for the scan (it can't stop early).
+    scan_sample = qs[-scan_queries:]
+    start = time.perf_counter()
+    scan_hits = [linear_scan(stored, q) for q in scan_sample]
+    per_query_scan = (time.perf_counter() - start) / len(scan_sample)
+    assert scan_hits == hits[-scan_queries:], "index and scan disagree"
+
+    return {
+        "hashes": n,
+        "build_s": round(build, 3),
+        "index_query_ms": round(per_query_index * 1000, 4),
+        "numpy_query_ms": round(per_query_packed * 1000, 4),
+        "scan_query_ms": round(per_query_scan * 1000, 2),
+        "speedup": round(per_query_scan / per_query_index, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--scan-queries", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for n in args.sizes:
+        print(json.dumps(bench_size(n, args.queries, args.scan_queries, rng)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Bytes and time spent ruling out bad picks, with and without the pre-flight checks.
+
+Runs the decision half of prepare_wallpaper (pre-flight, download, phash,
+near-duplicate lookup) against the fake site for a mix of picks: fresh images,
+re-uploads of already indexed images, dead links and oversized images. No
+MongoDB or Telegram is involved; the phash index is filled in memory.
+
+    python benchmarks/bench_preflight.py --picks 40
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from benchmarks.fake_site import FakeSiteHandler, jpeg_bytes, start_server  # noqa: E402
+from phash_index import MultiIndexHashIndex, parse_hash  # noqa: E402
+
+KINDS = ("fresh", "duplicate", "missing", "oversized")
+FULL = (2560, 1440)
+OVERSIZED = (3840, 2160)
+PREVIEW = (1280, 720)
+
+
+class MixedHandler(FakeSiteHandler):
+    def image_bytes(self, wid, width, height):
+        kind = KINDS[wid % len(KINDS)]
+        if kind == "missing":
+            return None
+        if kind == "duplicate":
+            wid = -wid  # same picture as the indexed original
+        return jpeg_bytes(wid, width, height)
+
+
+def image_url(base, wid, size):
+    return f"{base}/images/wallpapers/wallpaper-{wid}-{size[0]}x{size[1]}-{wid}.jpg"
+
+
+async def decide(wallpaper, preflight, workdir):
+    """Status the pick would get, without the Mongo writes."""
+    if preflight:
+        rejected = await bot.preflight_wallpaper(wallpaper)
+        if rejected:
+            return rejected[0]
+    path, _ = await bot.download_image(wallpaper["image_url"], os.path.join(workdir, "pick.jpg"))
+    if not path:
+        return "failed"
+    try:
+        phash = await bot.calculate_phash(path)
+    finally:
+        os.remove(path)
+    value = parse_hash(phash) if phash else None
+    if value is None:
+        return "failed"
+    return "skipped" if bot.PHASH_INDEX.find_within(value) is not None else "proceed"
+
+
+async def run(base, picks, preflight, workdir):
+    wallpapers = [
+        {
+            "image_url": image_url(base, wid, OVERSIZED if KINDS[wid % len(KINDS)] == "oversized" else FULL),
+            "preview_url": image_url(base, wid, PREVIEW),
+        }
+        for wid in range(1, picks + 1)
+    ]
+    before = bot.DOWNLOADED_BYTES.value()
+    started = time.perf_counter()
+    statuses = {}
+    for wallpaper in wallpapers:
+        status = await decide(wallpaper, preflight, workdir)
+        statuses[status] = statuses.get(status, 0) + 1
+    elapsed = time.perf_counter() - started
+    return {
+        "preflight": preflight,
+        "picks": picks,
+        "seconds": round(elapsed, 3),
+        "mb_downloaded": round((bot.DOWNLOADED_BYTES.value() - before) / 1e6, 2),
+        "statuses": statuses,
+    }
+
+
+async def main_async(args):
+    server, base = start_server(latency=args.latency, handler=MixedHandler)
+    # Oversized means "over the pixel limit": make 4K the first size that fails.
+    bot.MAX_IMAGE_PIXELS = FULL[0] * FULL[1]
+    bot.PHASH_INDEX = MultiIndexHashIndex(bot.SIMILARITY_THRESHOLD - 1)
+    for wid in range(1, args.picks + 1):
+        if KINDS[wid % len(KINDS)] == "duplicate":
+            phash = bot.compute_phash(io.BytesIO(jpeg_bytes(-wid, *PREVIEW)))
+            bot.PHASH_INDEX.add_hex(phash)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for preflight in (False, True):
+                results.append(await run(base, args.picks, preflight, workdir))
+    finally:
+        await bot.close_http_client()
+        server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--picks", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
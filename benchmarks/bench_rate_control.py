@@ -0,0 +1,106 @@
+"""Crawl a flaky, throttling fake site with and without scraper.py's rate control.
+
+"fixed" reproduces the old fetch layer: the whole concurrency ceiling at once,
+no retries and no end-of-run pass, so every 429/503 loses a page. "adaptive"
+uses the AIMD gate, jittered retries and the failed-URL queue.
+
+    python benchmarks/bench_rate_control.py --pages 20 --error-rate 0.05 --capacity 24
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_site  # noqa: E402
+import scraper  # noqa: E402
+from ratelimit import AimdController, ThreadGate, TokenBucket  # noqa: E402
+
+
+def configure(engine, mode, retries):
+    ceiling = scraper.MAX_PAGE_WORKERS * scraper.MAX_DETAIL_WORKERS if engine == "threads" else scraper.MAX_CONCURRENCY
+    if mode == "fixed":
+        scraper.FETCH_RETRIES = 0
+        controller = AimdController(ceiling, maximum=ceiling)
+        controller.on_congestion = lambda: None
+    else:
+        scraper.FETCH_RETRIES = retries
+        controller = AimdController(min(scraper.START_CONCURRENCY, ceiling), maximum=ceiling)
+    if engine == "threads":
+        scraper.GATE = ThreadGate(controller, TokenBucket(scraper.RATE_LIMIT))
+        return None, scraper.crawl_batch, scraper.fetch_listing, scraper.fetch_details, controller
+    async_engine = scraper.AsyncEngine()
+    async_engine.gate.controller = controller
+    return (async_engine, async_engine.crawl_batch, async_engine.fetch_listing,
+            async_engine.fetch_details, controller)
+
+
+def run(engine, mode, args):
+    server, base_url = fake_site.start_server(latency=args.latency, error_rate=args.error_rate, capacity=args.capacity)
+    handler = server.RequestHandlerClass
+    scraper.BASE_URL = base_url
+    async_engine, crawl_batch, fetch_listing, fetch_details, controller = configure(engine, mode, args.retries)
+    for failed in scraper.FAILED.values():
+        failed.clear()
+    page_nums = list(range(1, args.pages + 1))
+    docs = {}
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(0, len(page_nums), scraper.MAX_PAGE_WORKERS):
+                for doc in crawl_batch(page_nums[i:i + scraper.MAX_PAGE_WORKERS]):
+                    docs[doc["wallpaper_url"]] = doc
+            if mode == "adaptive":
+                scraper.save_new_items = lambda results, coll=None: [
+                    docs.setdefault(r["wallpaper_url"], r) for r in results
+                ]
+                scraper.retry_failed(fetch_listing, fetch_details)
+    finally:
+        scraper.save_new_items = SAVE_NEW_ITEMS
+        if async_engine:
+            async_engine.close()
+        server.shutdown()
+    elapsed = time.perf_counter() - start
+    return {
+        "engine": engine,
+        "mode": mode,
+        "documents": len(docs),
+        "expected": args.pages * fake_site.PER_PAGE,
+        "seconds": round(elapsed, 2),
+        "requests": handler.requests_served,
+        "throttled": handler.throttled,
+        "errors": handler.errors,
+        "final_window": controller.window,
+        "decreases": controller.decreases,
+    }
+
+
+SAVE_NEW_ITEMS = scraper.save_new_items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="server-side delay per request (s)")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="share of requests answered with 503")
+    parser.add_argument("--capacity", type=int, default=24, help="in-flight requests before the server sends 429")
+    parser.add_argument("--retries", type=int, default=scraper.FETCH_RETRIES)
+    parser.add_argument("--engine", choices=["threads", "async", "both"], default="both")
+    args = parser.parse_args()
+
+    engines = ["threads", "async"] if args.engine == "both" else [args.engine]
+    for engine in engines:
+        for mode in ("fixed", "adaptive"):
+            r = run(engine, mode, args)
+            print(f"{r['engine']:>8} {r['mode']:>8}: {r['documents']}/{r['expected']} docs in {r['seconds']}s, "
+                  f"{r['requests']} requests ({r['throttled']} throttled, {r['errors']} errors), "
+                  f"window {r['final_window']} after {r['decreases']} decreases")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Compare the threaded and asyncio crawl engines of scraper.py.
+
+Both engines crawl the same pages of a local fake site (no MongoDB involved);
+each runs in its own subprocess so peak RSS is measured per engine.
+
+    python benchmarks/bench_scraper_engines.py --pages 20 --latency 0.02
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_site  # noqa: E402
+
+
+def run_worker(engine, base_url, pages):
+    import contextlib
+    import io
+
+    import scraper
+
+    scraper.BASE_URL = base_url
+    page_nums = list(range(1, pages + 1))
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if engine == "async":
+            async_engine = scraper.AsyncEngine()
+            try:
+                docs = []
+                for i in range(0, len(page_nums), scraper.MAX_PAGE_WORKERS):
+                    docs.extend(async_engine.crawl_batch(page_nums[i:i + scraper.MAX_PAGE_WORKERS]))
+            finally:
+                async_engine.close()
+        else:
+            docs = []
+            for i in range(0, len(page_nums), scraper.MAX_PAGE_WORKERS):
+                docs.extend(scraper.crawl_batch(page_nums[i:i + scraper.MAX_PAGE_WORKERS]))
+    elapsed = time.perf_counter() - start
+    canonical = json.dumps(sorted(docs, key=lambda d: d["wallpaper_url"]), sort_keys=True)
+    return {
+        "engine": engine,
+        "pages": pages,
+        "documents": len(docs),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "digest": hashlib.sha256(canonical.encode()).hexdigest(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="server-side delay per request (s)")
+    parser.add_argument("--worker", choices=["threads", "async"], help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.base_url, args.pages)))
+        return
+
+    server, base_url = fake_site.start_server(latency=args.latency)
+    try:
+        results = []
+        for engine in ("threads", "async"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--worker", engine, "--base-url", base_url, "--pages", str(args.pages)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+    finally:
+        server.shutdown()
+
+    for r in results:
+        print(f"{r['engine']:>8}: {r['documents']} docs, {r['pages_per_sec']} pages/s, "
+              f"peak RSS {r['peak_rss_mb']} MB")
+    same = len({r["digest"] for r in results}) == 1
+    print("Documents identical across engines:", "yes" if same else "NO")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Cold-start cost of bot.py: import time and time to first post.
+
+Reports the cumulative import time of ``bot`` itself (``python -X
+importtime``), the heaviest modules pulled in, and the same for the
+dependencies bot.py imports lazily (what the first post pays on top).
+
+Time to first post runs one group's post in a fresh interpreter against the
+stand-ins from benchmarks/run.py: the fake site, mongomock and
+FakeTelegramClient. It is reported from bot.py's START_TIME (what the bot logs
+as "Time to first post: ...s") and from the moment the interpreter was
+launched; the stand-ins' setup happens before ``import bot`` and is reported
+separately.
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_DEPS = [
+    "telethon",
+    "motor.motor_asyncio",
+    "httpx",
+    "apscheduler.schedulers.asyncio",
+    "apscheduler.jobstores.mongodb",
+    "PIL.Image",
+    "imagehash",
+    "numpy",
+]
+
+
+def importtime(statement):
+    """Run ``statement`` in a fresh interpreter; return {module: cumulative_us} and top-level totals."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    top_level = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, raw_name = line[len("import time:"):].split("|")
+        name = raw_name.strip()
+        modules[name] = int(cumulative_us)
+        # Nested imports are indented by two spaces per level after the separator.
+        if len(raw_name) - len(raw_name.lstrip()) == 1:
+            top_level += int(cumulative_us)
+    return modules, top_level
+
+
+def first_post_worker(base_url, tg_latency):
+    """Post one wallpaper to one group from a cold start; print the timings as JSON."""
+    started = time.monotonic()
+    sys.path.insert(0, ROOT)
+    from benchmarks.run import FakeTelegramClient, async_store, open_store, quiet
+
+    coll = open_store()
+    client = FakeTelegramClient(latency=tg_latency)
+    setup = time.monotonic() - started
+
+    import bot
+    from phash_index import MultiIndexHashIndex
+    from ratelimit import UploadBudget
+
+    name, cfg = next(iter(bot.BOT_GROUPS.items()))
+    bot.BOT_GROUPS = {name: cfg}
+    coll.insert_many([{
+        "wallpaper_url": f"{base_url}/bench/wallpaper-{wid}.html",
+        "image_url": f"{base_url}/images/wallpapers/wallpaper-{wid}-2560x1440-{wid}.jpg",
+        "preview_url": f"{base_url}/images/wallpapers/wallpaper-{wid}-1280x720-{wid}.jpg",
+        "category": cfg["categories"][0],
+        "tags": ["bench"],
+        "status": "pending",
+        "rand": random.random(),
+    } for wid in range(1, 11)])
+
+    async def go():
+        bot.collection = async_store(coll)
+        bot.PHASH_INDEX = MultiIndexHashIndex(bot.SIMILARITY_THRESHOLD - 1)
+        bot.PHASH_INDEX_AS_OF = datetime.now(timezone.utc)
+        bot.PHASH_REFRESHED = time.monotonic()
+        bot.HD_SEND_DELAY = 0
+        bot.TG_CLIENT = client
+        bot.UPLOAD_BUDGET = UploadBudget(1, 0)
+        bot.DISPATCHER = bot.Dispatcher(1)
+        bot.DISPATCHER.start()
+        await bot.run_group_job(name)
+        await bot.DISPATCHER.join()
+        await bot.DISPATCHER.stop()
+        await bot.close_http_client()
+
+    with tempfile.TemporaryDirectory() as workdir, quiet():
+        os.chdir(workdir)  # download_image writes to the working directory
+        asyncio.run(go())
+    posted_at = [t for times in client.posted_at.values() for t in times]
+    if not posted_at:
+        raise SystemExit("nothing was posted")
+    print(json.dumps({
+        "stand_in_setup_s": setup,
+        "first_post_s": min(posted_at) - bot.START_TIME,
+        "first_post_at": min(posted_at),
+    }))
+
+
+def first_post(base_url, tg_latency):
+    """Run first_post_worker in a fresh interpreter; add the time since its launch."""
+    launched = time.monotonic()
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--first-post-worker", "--base-url", base_url,
+         "--tg-latency", str(tg_latency)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode:
+        raise SystemExit(f"first post run failed:\n{proc.stderr[-3000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    # time.monotonic() is system-wide, so the worker's timestamps compare with ours.
+    result["launch_to_first_post_s"] = result.pop("first_post_at") - launched
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--site-latency", type=float, default=0.02, help="fake site seconds per request")
+    parser.add_argument("--tg-latency", type=float, default=0.05, help="fake Telegram seconds per call")
+    parser.add_argument("--first-post-worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.first_post_worker:
+        first_post_worker(args.base_url, args.tg_latency)
+        return
+
+    bot_ms, lazy_ms = [], []
+    modules = {}
+    for _ in range(args.runs):
+        modules, _ = importtime("import bot")
+        bot_ms.append(modules["bot"] / 1000)
+        _, total = importtime("import bot; " + "; ".join(f"import {m}" for m in LAZY_DEPS))
+        lazy_ms.append(total / 1000)
+
+    sys.path.insert(0, ROOT)
+    from benchmarks.fake_site import start_server
+
+    server, base_url = start_server(latency=args.site_latency)
+    try:
+        posts = [first_post(base_url, args.tg_latency) for _ in range(args.runs)]
+    finally:
+        server.shutdown()
+
+    heaviest = sorted(((us / 1000, name) for name, us in modules.items() if name not in ("bot", "site")), reverse=True)
+    print(json.dumps({
+        "import_bot_ms": round(statistics.median(bot_ms), 1),
+        "import_bot_plus_lazy_deps_ms": round(statistics.median(lazy_ms), 1),
+        "heaviest_at_import": [{"module": name, "ms": round(ms, 1)} for ms, name in heaviest[:args.top]],
+        **{
+            key: round(statistics.median(post[key] for post in posts), 3)
+            for key in ("first_post_s", "launch_to_first_post_s", "stand_in_setup_s")
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Local stand-in for 4kwallpapers.com used by the benchmarks.
+
+Serves deterministic listing pages (``/`` and ``/?page=N``, or per category
+``/<category>/?page=N``) and detail pages
+(``/<category>/<slug>-<id>.html``) shaped like the real site closely enough for
+scraper.py to parse them. Pages carry an ETag and honour If-None-Match.
+The image URLs they link to (``/images/wallpapers/wallpaper-<id>-<W>x<H>-<id>.jpg``)
+serve real JPEGs at that resolution, with Range support.
+
+For failure testing the server can answer a share of requests with 503
+(error_rate) and throttle with 429 while more than capacity requests are in
+flight.
+"""
+import functools
+import hashlib
+import io
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CATEGORIES = ["anime", "cars", "nature", "space", "games", "abstract", "animals", "technology"]
+PER_PAGE = 24
+RESOLUTIONS = [(1280, 720), (1920, 1080), (2560, 1440), (3840, 2160)]
+IMAGE_PATH_RE = re.compile(r"^/images/wallpapers/wallpaper-(\d+)-(\d+)x(\d+)-\d+\.jpg$")
+RANGE_RE = re.compile(r"^bytes=(\d+)-(\d*)$")
+
+
+def wallpaper_id(page_num, index):
+    return page_num * 1000 + index
+
+
+def detail_path(wid):
+    category = CATEGORIES[wid % len(CATEGORIES)]
+    return f"/{category}/wallpaper-{wid}.html"
+
+
+def listing_html(page_num, per_page=PER_PAGE, category=None):
+    ids = [wallpaper_id(page_num, i) for i in range(per_page)]
+    if category:
+        # Spread the ids so that detail_path() files every one under this category.
+        ids = [wid * len(CATEGORIES) + CATEGORIES.index(category) for wid in ids]
+    links = "\n".join(
+        f'<a class="wallpapers__canvas_image" href="{detail_path(wid)}">'
+        f'<img src="/images/walls/thumbs/{wid}.jpg"></a>'
+        for wid in ids
+    )
+    return f"<html><head><title>Page {page_num}</title></head><body>{links}</body></html>"
+
+
+def detail_html(wid):
+    rng = random.Random(wid)
+    words = [f"tag{rng.randint(0, 500)}" for _ in range(rng.randint(3, 12))]
+    keywords = ", ".join(words + ["4K wallpaper", "Ultra HD & more"])
+    images = "\n".join(
+        f'<a href="/images/wallpapers/wallpaper-{wid}-{w}x{h}-{wid}.jpg">{w}x{h}</a>'
+        for w, h in rng.sample(RESOLUTIONS, len(RESOLUTIONS))
+    )
+    filler = "<p>" + "lorem ipsum " * 400 + "</p>"
+    return (
+        "<html><head>"
+        '<meta charset="utf-8">'
+        f'<meta name="description" content="Wallpaper {wid}">'
+        f'<meta name="keywords" content="{keywords.replace("&", "&amp;")}">'
+        f"</head><body>{filler}{images}</body></html>"
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def jpeg_bytes(seed, width, height):
+    """A smooth, seed-determined picture: same seed, same phash at every resolution."""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    small = Image.new("RGB", (8, 8))
+    small.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(64)])
+    out = io.BytesIO()
+    small.resize((width, height), Image.BILINEAR).save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+    max_pages = 1000
+    error_rate = 0.0
+    capacity = 0
+    requests_served = 0
+    not_modified = 0
+    throttled = 0
+    errors = 0
+    in_flight = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body, content_type="text/html; charset=utf-8"):
+        data = body.encode() if isinstance(body, str) else body
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        cls = type(self)
+        with cls.lock:
+            cls.requests_served += 1
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            with cls.lock:
+                cls.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        headers = {}
+        ranged = RANGE_RE.match(self.headers.get("Range", "")) if status == 200 else None
+        if self.headers.get("If-Range", etag) != etag:
+            ranged = None  # changed since the client's first request: send it whole
+        if ranged:
+            start = int(ranged.group(1))
+            end = min(int(ranged.group(2) or len(data) - 1), len(data) - 1)
+            if start >= len(data):
+                headers["Content-Range"] = f"bytes */{len(data)}"
+                status, data = 416, b""
+            else:
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+                data = data[start:end + 1]
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def image_bytes(self, wid, width, height):
+        """JPEG served for an image URL; subclasses override it to fake duplicates or oversized files."""
+        return jpeg_bytes(wid, width, height)
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            overloaded = self.capacity and cls.in_flight > self.capacity
+            failing = not overloaded and self.error_rate and random.random() < self.error_rate
+            cls.throttled += bool(overloaded)
+            cls.errors += bool(failing)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if overloaded:
+                return self.send_body(429, "slow down", "text/plain")
+            if failing:
+                return self.send_body(503, "unavailable", "text/plain")
+            self.route()
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def route(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/":
+            page_num = int(parse_qs(parsed.query).get("page", ["1"])[0])
+            per_page = PER_PAGE if page_num <= self.max_pages else 0
+            return self.send_body(200, listing_html(page_num, per_page))
+        parts = parsed.path.strip("/").split("/")
+        if len(parts) == 1 and parts[0] in CATEGORIES:
+            page_num = int(parse_qs(parsed.query).get("page", ["1"])[0])
+            per_page = PER_PAGE if page_num <= self.max_pages else 0
+            return self.send_body(200, listing_html(page_num, per_page, parts[0]))
+        if len(parts) == 2 and parts[1].startswith("wallpaper-") and parts[1].endswith(".html"):
+            return self.send_body(200, detail_html(int(parts[1][len("wallpaper-"):-len(".html")])))
+        image = IMAGE_PATH_RE.match(parsed.path)
+        if image:
+            wid, width, height = map(int, image.groups())
+            data = self.image_bytes(wid, width, height)
+            if data is None:
+                return self.send_body(404, "not found", "text/plain")
+            return self.send_body(200, data, "image/jpeg")
+        self.send_body(404, "not found", "text/plain")
+
+
+class FakeSiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connection bursts and skews the numbers.
+    request_queue_size = 1024
+
+
+def start_server(latency=0.0, max_pages=1000, handler=FakeSiteHandler, error_rate=0.0, capacity=0):
+    """Start the fake site on a free local port; return (server, base_url)."""
+    handler_cls = type("ConfiguredHandler", (handler,), {
+        "latency": latency, "max_pages": max_pages, "error_rate": error_rate, "capacity": capacity,
+        "lock": threading.Lock(),
+    })
+    server = FakeSiteServer(("127.0.0.1", 0), handler_cls)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
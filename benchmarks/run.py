@@ -0,0 +1,490 @@
+"""Reproducible benchmark suite for scraper.py and bot.py, with local stand-ins only.
+
+Each scenario runs in its own subprocess so its peak RSS is its own. The
+stand-ins are:
+
+- the fake site: synthetic listing and detail pages plus generated JPEGs;
+- MongoDB: mongomock (pip install mongomock), or a throwaway database on a
+  real mongod with --mongo-uri;
+- Telegram: FakeTelegramClient, a TelegramClient stand-in with per-call
+  latency and a shared upload link of --bandwidth bytes/s.
+
+Scenarios:
+
+    full_crawl         crawl --pages listing pages into an empty collection
+    incremental_crawl  full crawl, forget the newest --new-pages pages, re-crawl incrementally
+    dedup              load --dedup-sizes stored phashes into the bot's index and time lookups
+    posting_burst      every BOT_GROUPS group (x --group-copies) posts at once via the dispatcher
+
+Results go to stdout as JSON (and to --output). --compare diffs the figures
+against an earlier results file, e.g. one produced on another commit:
+
+    python benchmarks/run.py --output before.json
+    git checkout my-branch
+    python benchmarks/run.py --compare before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_site  # noqa: E402
+
+SCENARIOS = ("full_crawl", "incremental_crawl", "dedup", "posting_burst")
+BENCH_DB = "wallrunner_bench"
+
+
+# --- Stand-ins ---
+def open_store(mongo_uri=None):
+    """An empty wallpapers collection: mongomock, or a dropped-and-recreated database on mongo_uri."""
+    if not mongo_uri:
+        import mongomock
+
+        return mongomock.MongoClient()[BENCH_DB]["wallpapers"]
+    from pymongo import MongoClient
+
+    client = MongoClient(mongo_uri)
+    client.drop_database(BENCH_DB)
+    return client[BENCH_DB]["wallpapers"]
+
+
+def async_store(coll, mongo_uri=None):
+    """What bot.py expects as its Motor collection; call it on the running loop."""
+    if not mongo_uri:
+        return AsyncCollection(coll)
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    return AsyncIOMotorClient(mongo_uri)[BENCH_DB]["wallpapers"]
+
+
+class AsyncCollection:
+    """Enough of Motor's collection API over a mongomock collection for bot.py."""
+
+    def __init__(self, coll):
+        self.sync = coll
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.sync.find(*args, **kwargs))
+
+    def aggregate(self, *args, **kwargs):
+        return AsyncCursor(self.sync.aggregate(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = iter(cursor)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.cursor)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeMedia:
+    def __init__(self, media_id):
+        self.id = media_id
+
+
+class FakeMessage:
+    def __init__(self, message_id, chat_id, document):
+        self.id = message_id
+        self.chat_id = chat_id
+        self.photo = None if document else FakeMedia(message_id)
+        self.document = FakeMedia(message_id) if document else None
+
+    def to_dict(self):
+        return {"_": "Message", "id": self.id, "peer_id": self.chat_id}
+
+
+class FakeTelegramClient:
+    """TelegramClient stand-in for bot.post_wallpaper.
+
+    Every call costs latency seconds. Uploads also share one link of bandwidth
+    bytes/s: an upload that starts with n others in flight runs at 1/(n+1) of
+    it. flood_rate of the uploads raise FloodWaitError(flood_seconds).
+    """
+
+    def __init__(self, latency=0.05, bandwidth=20e6, flood_rate=0.0, flood_seconds=1):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.rng = random.Random(0)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.uploaded_bytes = 0
+        self.flood_waits = 0
+        self.flood_sleep_threshold = 60  # TelegramClient's default
+        self.posted_at = {}
+        self._ids = iter(range(1, 1 << 62))
+
+    async def upload_file(self, path):
+        from telethon.errors import FloodWaitError
+
+        size = os.path.getsize(path)
+        if self.rng.random() < self.flood_rate:
+            self.flood_waits += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency + size * self.in_flight / self.bandwidth)
+        finally:
+            self.in_flight -= 1
+        self.uploaded_bytes += size
+        return FakeMedia(next(self._ids))
+
+    async def send_file(self, chat_id, file, caption=None, force_document=False):
+        if isinstance(file, str):
+            await self.upload_file(file)
+        await asyncio.sleep(self.latency)
+        if force_document:
+            self.posted_at.setdefault(chat_id, []).append(time.monotonic())
+        return FakeMessage(next(self._ids), chat_id, force_document)
+
+
+# --- Scenarios (run in the worker subprocess) ---
+def quiet():
+    """Silence scraper.py's prints and bot.py's INFO logging."""
+    import logging
+
+    logging.getLogger().setLevel(logging.ERROR)
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def crawl_into(coll, base_url, engine):
+    """Full crawl of the fake site into coll; return (documents, seconds)."""
+    import scraper
+
+    scraper.BASE_URL = base_url
+    scraper.collection = coll
+    start = time.perf_counter()
+    with quiet():
+        if engine == "async":
+            async_engine = scraper.AsyncEngine()
+            try:
+                scraper.crawl(async_engine.crawl_batch)
+            finally:
+                async_engine.close()
+        else:
+            scraper.crawl(scraper.crawl_batch)
+    return coll.count_documents({}), time.perf_counter() - start
+
+
+def full_crawl(args):
+    coll = open_store(args.mongo_uri)
+    documents, seconds = crawl_into(coll, args.base_url, args.engine)
+    return {
+        "engine": args.engine,
+        "pages": args.pages,
+        "documents": documents,
+        "seconds": round(seconds, 3),
+        "documents_per_sec": round(documents / seconds, 1),
+    }
+
+
+def incremental_crawl(args):
+    import scraper
+
+    # Store what a full crawl would have stored, minus the newest new_pages
+    # pages, without going through the site (so site_requests is the re-crawl's).
+    scraper.BASE_URL = args.base_url
+    coll = scraper.collection = open_store(args.mongo_uri)
+    coll.insert_many([
+        scraper.build_wallpaper_doc(
+            scraper.wallpaper_url_for(fake_site.detail_path(wid)), fake_site.detail_html(wid))
+        for page in range(args.new_pages + 1, args.pages + 1)
+        for wid in (fake_site.wallpaper_id(page, i) for i in range(fake_site.PER_PAGE))
+    ])
+
+    start = time.perf_counter()
+    with quiet():
+        seen = scraper.load_seen_urls(coll)
+        if args.engine == "async":
+            async_engine = scraper.AsyncEngine()
+            try:
+                new = scraper.crawl_incremental(async_engine.fetch_listing, async_engine.fetch_details, seen)
+            finally:
+                async_engine.close()
+        else:
+            new = scraper.crawl_incremental(scraper.fetch_listing, scraper.fetch_details, seen)
+    seconds = time.perf_counter() - start
+    return {
+        "engine": args.engine,
+        "stored": coll.count_documents({}) - new,
+        "new_pages": args.new_pages,
+        "new_documents": new,
+        "seconds": round(seconds, 3),
+    }
+
+
+def dedup(args):
+    """Index load and lookup cost at args.size stored phashes.
+
+    load_seconds is the usual startup: the snapshot plus an (empty) catch-up
+    query. cold_load_seconds, reading every phash from the collection, is
+    only measured on a real mongod; mongomock iterates large cursors in
+    quadratic time.
+    """
+    import bot
+    from phash_index import parse_hash, save_snapshot
+
+    rng = random.Random(args.size)
+    coll = open_store(args.mongo_uri)
+    stored = [f"{rng.getrandbits(64):016x}" for _ in range(args.size)]
+    stored_at = datetime.now(timezone.utc)
+    for i in range(0, len(stored), 10000):
+        coll.insert_many([{"phash": p, "status": "posted", "updated_at": stored_at} for p in stored[i:i + 10000]])
+    snapshot = os.path.join(tempfile.mkdtemp(), "phash_index.npy")
+
+    def near(hex_hash):
+        value = int(hex_hash, 16)
+        for b in rng.sample(range(64), rng.randint(1, bot.SIMILARITY_THRESHOLD - 1)):
+            value ^= 1 << b
+        return value
+
+    queries = [near(rng.choice(stored)) if i % 2 else rng.getrandbits(64) for i in range(args.queries)]
+
+    async def load():
+        bot.collection = async_store(coll, args.mongo_uri)
+        bot.PHASH_SNAPSHOT = snapshot
+        start = time.perf_counter()
+        with quiet():
+            await bot.load_phash_index()
+        return time.perf_counter() - start
+
+    cold_load_seconds = None
+    if args.mongo_uri:
+        cold_load_seconds = round(asyncio.run(load()), 3)  # also writes the snapshot
+    else:
+        save_snapshot(snapshot, [int(p, 16) for p in stored], datetime.now(timezone.utc))
+    load_seconds = asyncio.run(load())
+    latencies = []
+    hits = 0
+    for q in queries:
+        start = time.perf_counter()
+        hits += bot.PHASH_INDEX.find_within(parse_hash(f"{q:016x}")) is not None
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "backend": bot.PHASH_BACKEND,
+        "stored": args.size,
+        "load_seconds": round(load_seconds, 3),
+        "cold_load_seconds": cold_load_seconds,
+        "queries": len(queries),
+        "hits": hits,
+        "lookup_p50_us": round(latencies[len(latencies) // 2] * 1e6, 1),
+        "lookup_p95_us": round(latencies[int(len(latencies) * 0.95)] * 1e6, 1),
+    }
+
+
+def posting_burst(args):
+    import bot
+    from ratelimit import UploadBudget
+
+    groups = {}
+    for copy in range(args.group_copies):
+        for name, cfg in bot.BOT_GROUPS.items():
+            groups[f"{name}_{copy}"] = {**cfg, "id": cfg["id"] - copy * 10 ** 6}
+    bot.BOT_GROUPS = groups
+    coll = open_store(args.mongo_uri)
+    wid = 0
+    docs = []
+    for cfg in groups.values():
+        for _ in range(args.stock):
+            wid += 1
+            docs.append({
+                "wallpaper_url": f"{args.base_url}/bench/wallpaper-{wid}.html",
+                "image_url": f"{args.base_url}/images/wallpapers/wallpaper-{wid}-2560x1440-{wid}.jpg",
+                "preview_url": f"{args.base_url}/images/wallpapers/wallpaper-{wid}-1280x720-{wid}.jpg",
+                "category": cfg["categories"][0],
+                "tags": ["bench"],
+                "status": "pending",
+                "rand": random.random(),
+            })
+    coll.insert_many(docs)
+    client = FakeTelegramClient(args.tg_latency, args.bandwidth, args.flood_rate)
+
+    async def go():
+        from phash_index import MultiIndexHashIndex
+
+        bot.collection = async_store(coll, args.mongo_uri)
+        bot.PHASH_INDEX = MultiIndexHashIndex(bot.SIMILARITY_THRESHOLD - 1)
+        bot.PHASH_INDEX_AS_OF = datetime.now(timezone.utc)
+        bot.PHASH_REFRESHED = time.monotonic()
+        bot.HD_SEND_DELAY = 0
+        bot.TG_CLIENT = client
+        bot.UPLOAD_BUDGET = UploadBudget(args.uploads_in_flight, args.upload_rate)
+        bot.DISPATCHER = bot.Dispatcher(args.workers)
+        bot.DISPATCHER.start()
+        start = time.monotonic()
+        for _ in range(args.rounds):
+            for name in groups:
+                await bot.run_group_job(name)
+            await bot.DISPATCHER.join()
+        seconds = time.monotonic() - start
+        await bot.DISPATCHER.stop()
+        await bot.close_http_client()
+        return start, seconds
+
+    with tempfile.TemporaryDirectory() as workdir, quiet():
+        os.chdir(workdir)  # download_image writes to the working directory
+        start, seconds = asyncio.run(go())
+    first_posts = sorted(times[0] - start for times in client.posted_at.values())
+    posted = coll.count_documents({"status": "posted"})
+    return {
+        "groups": len(groups),
+        "rounds": args.rounds,
+        "workers": args.workers,
+        "uploads_in_flight": args.uploads_in_flight,
+        "posted": posted,
+        "failed": coll.count_documents({"status": "failed"}),
+        "seconds": round(seconds, 3),
+        "posts_per_sec": round(posted / seconds, 2),
+        "first_post_p50_s": round(first_posts[len(first_posts) // 2], 3) if first_posts else None,
+        "first_post_max_s": round(first_posts[-1], 3) if first_posts else None,
+        "peak_concurrent_uploads": client.peak_in_flight,
+        "uploaded_mb": round(client.uploaded_bytes / 1e6, 2),
+        "flood_waits": client.flood_waits,
+    }
+
+
+# --- Driver ---
+def run_worker(args):
+    result = globals()[args.worker](args)
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+def spawn(scenario, args, base_url, **extra):
+    """Run one scenario in a fresh interpreter; return its result dict."""
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", scenario, "--base-url", base_url]
+    for key, value in {**vars(args), **extra}.items():
+        if key in ("worker", "base_url", "scenarios", "output", "compare", "dedup_sizes") or value is None:
+            continue
+        cmd += [f"--{key.replace('_', '-')}", str(value)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode:
+        raise SystemExit(f"{scenario} failed:\n{proc.stderr[-3000:]}")
+    return {"scenario": scenario, **json.loads(proc.stdout.strip().splitlines()[-1])}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return (result["scenario"], result.get("engine"), result.get("stored") if result["scenario"] == "dedup" else None)
+
+
+def compare(baseline, results):
+    """Print each numeric figure next to the baseline's, with the relative change."""
+    old = {result_key(r): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('started_at')}):")
+    for result in results:
+        before = old.get(result_key(result))
+        if before is None:
+            continue
+        label = " ".join(str(part) for part in result_key(result) if part is not None)
+        for key, value in result.items():
+            was = before.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(was, (int, float)) or value == was:
+                continue
+            change = f"{(value - was) / was * 100:+.1f}%" if was else "new"
+            print(f"  {label:<28} {key:<24} {was:>10} -> {value:<10} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", metavar="FILE", help="also write the results JSON here")
+    parser.add_argument("--compare", metavar="FILE", help="print the change against an earlier results file")
+    parser.add_argument("--mongo-uri", help="use a throwaway database on this mongod instead of mongomock")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake site delay per request (s)")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument("--pages", type=int, default=20, help="listing pages on the fake site")
+    parser.add_argument("--new-pages", type=int, default=2, help="pages the incremental crawl has to pick up")
+    parser.add_argument("--dedup-sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=2000, help="phash lookups per dedup size")
+    parser.add_argument("--group-copies", type=int, default=1, help="post to BOT_GROUPS this many times over")
+    parser.add_argument("--stock", type=int, default=3, help="pending wallpapers per group")
+    parser.add_argument("--rounds", type=int, default=1, help="times every group posts")
+    parser.add_argument("--workers", type=int, default=4, help="dispatcher workers")
+    parser.add_argument("--uploads-in-flight", type=int, default=2)
+    parser.add_argument("--upload-rate", type=int, default=0, help="upload budget in bytes/s (0 = unlimited)")
+    parser.add_argument("--tg-latency", type=float, default=0.05, help="fake Telegram delay per call (s)")
+    parser.add_argument("--bandwidth", type=float, default=20e6, help="fake Telegram upload link (bytes/s)")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="share of uploads answered with FloodWait")
+    parser.add_argument("--worker", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args)))
+        return
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "store": "mongod" if args.mongo_uri else "mongomock",
+        "results": [],
+    }
+    server, base_url = fake_site.start_server(latency=args.latency, max_pages=args.pages)
+    handler = server.RequestHandlerClass
+    try:
+        for scenario in args.scenarios:
+            sizes = args.dedup_sizes if scenario == "dedup" else [None]
+            for size in sizes:
+                served = handler.requests_served
+                print(f"Running {scenario}{f' ({size})' if size else ''}...", file=sys.stderr)
+                result = spawn(scenario, args, base_url, size=size)
+                if scenario != "dedup":
+                    result["site_requests"] = handler.requests_served - served
+                report["results"].append(result)
+    finally:
+        server.shutdown()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,34 @@
+import argparse
+import io
 import random
 import logging
 import asyncio
 import os
-import httpx
-from telethon import TelegramClient
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import time
 from urllib.parse import urlparse
 import hashlib
-from PIL import Image
-import imagehash
-from datetime import datetime
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 import signal
 import aiofiles
 import aiofiles.os as async_os
-from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import OperationFailure
+import metrics
+from phash_index import distinct_values, parse_hash, load_snapshot, save_snapshot
+from image_hash import (
+    DOWNLOAD_CHUNK_SIZE, MAX_IMAGE_BYTES, PHASH_BACKEND, SIMILARITY_THRESHOLD, compute_phash, new_phash_index,
+    similar_reasons,
+)
+from image_header import read_dimensions
+from ratelimit import UploadBudget
+
+# Heavy dependencies (Telethon, Motor, httpx, APScheduler, PIL/imagehash and the
+# numpy/scipy stack behind them) are imported where they are first used, so a
+# cron-style run with nothing due never pays for them.
+START_TIME = time.monotonic()
 
 # --- Load environment ---
 load_dotenv()
@@ -37,11 +50,10 @@ MONGO_URI = os.getenv("FIREBASE_MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = "prdp"
 COLLECTION_NAME = "wallpapers"
 
-log.info("Initializing Mongo client...")
-mongo_client = AsyncIOMotorClient(MONGO_URI)
-db = mongo_client[DB_NAME]
-collection = db[COLLECTION_NAME]
-log.info(f"MongoDB target: {MONGO_URI}/{DB_NAME}.{COLLECTION_NAME}")
+# Created by init_mongo() inside main(), not at import time.
+mongo_client = None
+db = None
+collection = None
 
 # --- Bot Groups ---
 try:
@@ -55,9 +67,74 @@ except ImportError:
     }
 
 # --- Globals ---
-SIMILARITY_THRESHOLD = 5
 shutdown_requested = False
 ACTIVE_TASKS = set()
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", 3))
+HTTP_CLIENT = None
+# Pre-flight: the first PREFLIGHT_BYTES of an image (and the response headers) rule
+# out broken, non-image and oversized files, and a small preview variant is hashed
+# against the phash index, before the full download.
+PREFLIGHT = os.getenv("PREFLIGHT", "1") == "1"
+PREFLIGHT_BYTES = int(os.getenv("PREFLIGHT_BYTES", 64 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 89_478_485))  # PIL's decompression-bomb threshold
+PREVIEW_MAX_BYTES = 2 * 1024 * 1024
+# Resampling moves a bit or two of the average hash, so previews match more strictly.
+PREVIEW_SIMILARITY = SIMILARITY_THRESHOLD - 2
+HD_SEND_DELAY = float(os.getenv("HD_SEND_DELAY", 1))
+TG_PHOTO_MAX_BYTES = 10 * 1000 * 1000
+TG_PHOTO_MAX_SIDE_SUM = 10000
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", 1))
+PREFETCH_IDLE_SECONDS = 600
+PREPARE_ATTEMPTS = 5
+# group id -> (queue of ready candidates, semaphore of free prefetch slots)
+PREFETCH_QUEUES = {}
+# image_urls picked by a job or prefetcher but not yet given a final status
+RESERVED_URLS = set()
+HASH_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("HASH_WORKERS", 2)), thread_name_prefix="hash")
+# Every stored phash, loaded once at startup and kept current by update_wallpaper_status
+# (PHASH_BACKEND in image_hash.py picks the structure; the numpy one is snapshotted here).
+PHASH_SNAPSHOT = os.getenv("PHASH_SNAPSHOT", "phash_index.npy")
+PHASH_INDEX = None
+PHASH_INDEX_AS_OF = None
+# Phashes stored by enrich.py while the bot runs are pulled in this often.
+PHASH_REFRESH_SECONDS = float(os.getenv("PHASH_REFRESH_SECONDS", 300))
+PHASH_REFRESHED = 0.0
+STATUS_FLUSH_SECONDS = float(os.getenv("STATUS_FLUSH_SECONDS", 30))
+STATUS_BATCH_SIZE = int(os.getenv("STATUS_BATCH_SIZE", 50))
+STATUS_WRITER = None
+# Store only message/chat/media ids of posted messages instead of full Telethon dumps.
+COMPACT_TG_RESPONSE = os.getenv("COMPACT_TG_RESPONSE", "1") == "1"
+JOBSTORE_COLLECTION = "scheduler_jobs"
+TG_CLIENT = None
+FIRST_POST_LOGGED = False
+# Scheduler jobs only enqueue; DISPATCH_WORKERS workers post from one queue and
+# share one upload budget, so many groups firing together don't all upload at once.
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", 4))
+UPLOADS_IN_FLIGHT = int(os.getenv("UPLOADS_IN_FLIGHT", 2))
+UPLOAD_BYTES_PER_SECOND = int(os.getenv("UPLOAD_BYTES_PER_SECOND", 0))
+# FloodWaits up to this long are slept off inside Telethon while posting; longer ones
+# reschedule the group. Login and other calls keep the client's own threshold.
+FLOOD_SLEEP_THRESHOLD = int(os.getenv("FLOOD_SLEEP_THRESHOLD", 5))
+SENDS_IN_FLIGHT = 0
+CLIENT_FLOOD_THRESHOLD = None
+DISPATCHER = None
+UPLOAD_BUDGET = None
+
+# --- Metrics ---
+# Served at http://127.0.0.1:METRICS_PORT/metrics and/or written to METRICS_FILE
+# after every job and at shutdown (for --once runs that exit before a scrape).
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+STAGE_SECONDS = metrics.REGISTRY.histogram(
+    "wallbot_stage_seconds", "Time spent in each stage of the posting pipeline.", ["stage"])
+OUTCOMES = metrics.REGISTRY.counter(
+    "wallbot_wallpapers_total", "Wallpapers processed, by resulting status and reason.", ["status", "reason"])
+DOWNLOADED_BYTES = metrics.REGISTRY.counter("wallbot_downloaded_bytes_total", "Image bytes downloaded.")
+UPLOADED_BYTES = metrics.REGISTRY.counter("wallbot_uploaded_bytes_total", "Image bytes uploaded to Telegram.")
+PENDING_STOCK = metrics.REGISTRY.gauge(
+    "wallbot_pending_stock", "Pending wallpapers left in each group's categories.", ["group"])
+DISPATCH_QUEUED = metrics.REGISTRY.gauge("wallbot_dispatch_queued", "Group posts waiting in the dispatcher queue.")
+FLOOD_WAITS = metrics.REGISTRY.counter("wallbot_flood_waits_total", "Telegram FloodWait errors that rescheduled a post.")
 
 
 def handle_shutdown():
@@ -67,6 +144,17 @@ def handle_shutdown():
 
 
 # --- MongoDB Setup ---
+def init_mongo():
+    global mongo_client, db, collection
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    log.info("Initializing Mongo client...")
+    mongo_client = AsyncIOMotorClient(MONGO_URI)
+    db = mongo_client[DB_NAME]
+    collection = db[COLLECTION_NAME]
+    log.info(f"MongoDB target: {MONGO_URI}/{DB_NAME}.{COLLECTION_NAME}")
+
+
 async def ensure_indexes():
     logging.info("Checking MongoDB indexes (safe mode)...")
     try:
@@ -81,6 +169,8 @@ async def ensure_indexes():
         ("wallpaper_url", True),
         ("status", False),
         ("category", False),
+        ("updated_at", False),
+        ("sha256", False),
     ]:
         try:
             if field not in existing:
@@ -92,168 +182,973 @@ async def ensure_indexes():
         except Exception as e:
             logging.warning(f"Skipping index '{field}' due to: {e}")
 
+    # Random pending picks seek into this index (see get_random_wallpaper).
+    try:
+        await collection.create_index([("status", 1), ("category", 1), ("rand", 1)])
+    except Exception as e:
+        logging.warning(f"Skipping index 'status_category_rand' due to: {e}")
+
     logging.info("MongoDB index setup complete (safe mode).")
 
 
+async def ensure_random_keys():
+    """Give every document without one a uniform random 'rand' key in [0, 1)."""
+    try:
+        result = await collection.update_many({"rand": {"$exists": False}}, [{"$set": {"rand": {"$rand": {}}}}])
+        if result.modified_count:
+            log.info(f"Assigned random keys to {result.modified_count} wallpapers.")
+    except Exception as e:
+        log.warning(f"Could not backfill random keys: {e}")
+
+
 # --- Hashing ---
-def calculate_hashes(filepath):
+async def calculate_phash(filepath):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(HASH_EXECUTOR, compute_phash, filepath)
+
+
+async def load_phash_index():
+    """Build PHASH_INDEX from the snapshot plus anything hashed since, or from a full scan."""
+    global PHASH_INDEX, PHASH_INDEX_AS_OF, PHASH_REFRESHED
+    started_at = datetime.now(timezone.utc)
+
+    values, saved_at = load_snapshot(PHASH_SNAPSHOT)
+    if values is not None:
+        log.info(f"Loaded {len(values)} phashes from snapshot {PHASH_SNAPSHOT} ({saved_at.isoformat()})")
+        query = {"phash": {"$exists": True}, "updated_at": {"$gte": saved_at}}
+    else:
+        log.info("No phash snapshot found, loading every stored perceptual hash...")
+        values = []
+        query = {"phash": {"$exists": True}}
+
+    added = []
+    async for item in collection.find(query, {"phash": 1, "_id": 0}):
+        value = parse_hash(item["phash"])
+        if value is not None:
+            added.append(value)
+    if added or saved_at is None:
+        # Documents updated since the snapshot's stamp may already be in it (it
+        # holds everything indexed until shutdown), so each hash is kept once.
+        values = distinct_values(values, added)
+    index = new_phash_index(values)
+    PHASH_INDEX = index
+    PHASH_INDEX_AS_OF = started_at
+    PHASH_REFRESHED = time.monotonic()
+    log.info(f"Phash index ready: {len(index)} hashes ({len(added)} read from MongoDB, backend={PHASH_BACKEND}).")
+    if added or saved_at is None:
+        save_phash_snapshot()
+
+
+async def refresh_phash_index():
+    """Add the phashes enrich.py has stored since the index was loaded or last refreshed.
+
+    The bot's own status updates go into the index directly; this only picks
+    up pending wallpapers hashed in the background, so new picks are compared
+    against them too.
+    """
+    global PHASH_INDEX_AS_OF, PHASH_REFRESHED
+    if PHASH_INDEX is None or time.monotonic() - PHASH_REFRESHED < PHASH_REFRESH_SECONDS:
+        return
+    PHASH_REFRESHED = time.monotonic()
+    started_at = datetime.now(timezone.utc)
+    query = {"updated_at": {"$gte": PHASH_INDEX_AS_OF}, "enriched_at": {"$gte": PHASH_INDEX_AS_OF}}
+    count = 0
     try:
-        sha256_hash = hashlib.sha256()
-        with open(filepath, "rb") as f:
-            for block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(block)
-        sha256 = sha256_hash.hexdigest()
-        p_hash = str(imagehash.average_hash(Image.open(filepath)))
-        log.debug(f"Computed hashes for {filepath}: sha256={sha256[:8]}..., phash={p_hash}")
-        return sha256, p_hash
+        async for item in collection.find(query, {"phash": 1, "_id": 0}):
+            PHASH_INDEX.add_hex(item["phash"])
+            count += 1
     except Exception as e:
-        log.error(f"Hashing error for {filepath}: {e}")
-        return None, None
+        log.warning(f"Could not refresh the phash index: {e}")
+        return
+    PHASH_INDEX_AS_OF = started_at
+    if count:
+        log.info(f"Added {count} phashes stored by enrichment to the index.")
+
 
+def save_phash_snapshot():
+    # Stamp the snapshot with the load time rather than "now": other writers may
+    # have stored hashes since then, and the next catch-up query must see them.
+    try:
+        save_snapshot(PHASH_SNAPSHOT, distinct_values(PHASH_INDEX.values()), PHASH_INDEX_AS_OF)
+        log.info(f"Saved phash snapshot to {PHASH_SNAPSHOT}")
+    except Exception as e:
+        log.warning(f"Could not save phash snapshot: {e}")
 
-async def check_image_hashes_in_data(sha256, p_hash):
-    max_diff = 64
-    new_hash = imagehash.hex_to_hash(p_hash)
 
-    if await collection.find_one({"sha256": sha256}):
+async def check_image_hashes_in_data(sha256, p_hash, jpg_url=None, own_phash=None):
+    # The wallpaper's own document may already carry its hashes (enrich.py), and
+    # its own phash (own_phash) may be in the index: neither counts as a match.
+    if (STATUS_WRITER is not None and STATUS_WRITER.has_sha256(sha256)) or await collection.find_one(
+            {"sha256": sha256, "image_url": {"$ne": jpg_url}}):
         log.info("Duplicate SHA256 detected.")
         return "skipped", {"reason": "Duplicate"}
 
-    async for item in collection.find({"phash": {"$exists": True}}):
-        try:
-            db_hash = imagehash.hex_to_hash(item["phash"])
-            diff = new_hash - db_hash
-            if diff < SIMILARITY_THRESHOLD:
-                similarity = ((max_diff - diff) / max_diff) * 100
-                log.info(f"Similar image found (diff={diff}, {similarity:.1f}% similar)")
-                return "skipped", {"reason": "Similar", "diff": diff, "similarity": round(similarity, 1)}
-        except Exception:
-            continue
+    new_hash = parse_hash(p_hash)
+    diff = PHASH_INDEX.find_within(new_hash, exclude=parse_hash(own_phash)) if new_hash is not None else None
+    if diff is not None:
+        return "skipped", similar_reasons(diff)
     return "proceed", None
 
 
 # --- Mongo helpers ---
 async def get_random_wallpaper(categories):
     log.info(f"Fetching random pending wallpaper for {categories}")
-    pipeline = [
-        {"$match": {"status": "pending", "category": {"$in": categories}}},
-        {"$sample": {"size": 1}},
-    ]
-    async for doc in collection.aggregate(pipeline):
-        log.info(f"Selected wallpaper: {doc.get('image_url', 'N/A')}")
-        return doc
-    log.info("No pending wallpapers found.")
-    return None
+    match = {"status": "pending", "category": {"$in": categories}}
+    excluded = RESERVED_URLS | (STATUS_WRITER.urls() if STATUS_WRITER is not None else set())
+    if excluded:
+        match["image_url"] = {"$nin": list(excluded)}
+
+    # Seek to a random point on the (status, category, rand) index and take the
+    # next key, wrapping around: one short index walk no matter how big the stock
+    # is. Unlike $sample this is not uniform: a document is picked with probability
+    # equal to the gap between its rand and the next lower one among the matching
+    # documents. The keys are uniform, so gaps average 1/n, but they vary widely,
+    # and the same document wins again while it stays pending.
+    r = random.random()
+    doc = await collection.find_one({**match, "rand": {"$gte": r}}, sort=[("rand", 1)])
+    if doc is None:
+        doc = await collection.find_one({**match, "rand": {"$lt": r}}, sort=[("rand", 1)])
+    if doc is None:
+        # Documents imported without a random key yet.
+        async for doc in collection.aggregate([{"$match": match}, {"$sample": {"size": 1}}]):
+            break
+    if doc is None:
+        log.info("No pending wallpapers found.")
+        return None
+    log.info(f"Selected wallpaper: {doc.get('image_url', 'N/A')}")
+    return doc
 
 
 async def update_wallpaper_status(jpg_url, status, reasons=None, sha256=None, phash=None, tg_response=None):
     log.info(f"Updating status for {jpg_url[:80]} → {status}")
-    update_doc = {"$set": {"status": status}}
+    OUTCOMES.inc(status=status, reason=(reasons or {}).get("reason", ""))
+    update_doc = {"$set": {"status": status, "updated_at": datetime.now(timezone.utc)}}
     if sha256:
         update_doc["$set"]["sha256"] = sha256
     if phash:
         update_doc["$set"]["phash"] = phash
+        if PHASH_INDEX is not None:
+            PHASH_INDEX.add_hex(phash)
     if reasons:
         update_doc["$set"]["reasons"] = reasons
     if tg_response:
         update_doc["$set"]["tg_response"] = tg_response
-    await collection.update_one({"image_url": jpg_url}, update_doc)
+    if STATUS_WRITER is not None:
+        await STATUS_WRITER.add(jpg_url, update_doc["$set"])
+    else:
+        await collection.update_one({"image_url": jpg_url}, update_doc)
+
+
+class StatusWriter:
+    """Write-behind buffer for status updates.
+
+    Updates are merged per image_url and flushed with one unordered bulk_write
+    every STATUS_FLUSH_SECONDS, once STATUS_BATCH_SIZE are waiting, and at
+    shutdown. Until then the buffered wallpapers are kept out of
+    get_random_wallpaper and their SHA-256s still count for dedup.
+    """
+
+    def __init__(self, coll, interval=STATUS_FLUSH_SECONDS, batch_size=STATUS_BATCH_SIZE):
+        self.collection = coll
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pending = {}
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def urls(self):
+        return set(self.pending)
+
+    def has_sha256(self, sha256):
+        return any(fields.get("sha256") == sha256 for fields in self.pending.values())
+
+    async def add(self, jpg_url, fields):
+        self.pending.setdefault(jpg_url, {}).update(fields)
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            from pymongo import UpdateOne
+
+            # updated_at is stamped by the server as the update lands, not when it was
+            # queued: an incremental export that ran in between must still see it.
+            ops = [
+                UpdateOne({"image_url": url}, {
+                    "$set": {key: value for key, value in fields.items() if key != "updated_at"},
+                    "$currentDate": {"updated_at": True},
+                })
+                for url, fields in batch.items()
+            ]
+            try:
+                with STAGE_SECONDS.time(stage="status_flush"):
+                    await self.collection.bulk_write(ops, ordered=False)
+                log.info(f"Flushed {len(ops)} status updates.")
+            except Exception as e:
+                log.error(f"Status flush failed, keeping {len(ops)} updates for retry: {e}")
+                for url, fields in batch.items():
+                    self.pending[url] = {**fields, **self.pending.get(url, {})}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+
+
+def summarize_message(msg):
+    """The parts of a sent Telegram message we keep when COMPACT_TG_RESPONSE is on."""
+    media = msg.photo or msg.document
+    return {"message_id": msg.id, "chat_id": msg.chat_id, "media_id": media.id if media else None}
 
 
 # --- Download Image ---
+class DownloadTooLarge(Exception):
+    pass
+
+
+def get_http_client():
+    """One long-lived client for every image download, so connections are reused."""
+    global HTTP_CLIENT
+    if HTTP_CLIENT is None:
+        import httpx
+
+        HTTP_CLIENT = httpx.AsyncClient(
+            timeout=60,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+        )
+    return HTTP_CLIENT
+
+
+async def close_http_client():
+    global HTTP_CLIENT
+    if HTTP_CLIENT is not None:
+        await HTTP_CLIENT.aclose()
+        HTTP_CLIENT = None
+
+
 async def download_image(url, filename):
+    """Stream url to filename, hashing it on the way; return (filename, sha256) or (None, None).
+
+    Only one chunk is held in memory at a time. A dropped connection is retried
+    with a Range request from the last byte written, so the SHA-256 keeps running
+    over the same stream. The request carries If-Range with the first response's
+    ETag (or Last-Modified), so a file that changed in between comes back whole
+    (200) and the download restarts from scratch, as it does for servers that
+    ignore the range. Without either validator it restarts rather than resumes.
+    """
+    import httpx
+
     log.info(f"Downloading image: {url}")
+    client = get_http_client()
+    sha256_hash = hashlib.sha256()
+    written = 0
+    validator = None
+    for attempt in range(1, DOWNLOAD_RETRIES + 1):
+        headers = None
+        if written and validator:
+            headers = {"Range": f"bytes={written}-", "If-Range": validator}
+        elif written:
+            written = 0
+            sha256_hash = hashlib.sha256()
+        try:
+            async with client.stream("GET", url, headers=headers) as r:
+                if r.status_code == 416 or (written and r.status_code == 200):
+                    written = 0
+                    sha256_hash = hashlib.sha256()
+                    if r.status_code == 416:
+                        raise httpx.HTTPStatusError("Range not satisfiable", request=r.request, response=r)
+                r.raise_for_status()
+                if r.status_code == 200:
+                    # If-Range only takes a strong ETag; weak ones fall back to Last-Modified.
+                    etag = r.headers.get("ETag", "")
+                    validator = etag if etag and not etag.startswith("W/") else r.headers.get("Last-Modified")
+                expected = r.headers.get("Content-Length")
+                if expected and written + int(expected) > MAX_IMAGE_BYTES:
+                    raise DownloadTooLarge(f"{written + int(expected)} bytes > MAX_IMAGE_BYTES={MAX_IMAGE_BYTES}")
+                async with aiofiles.open(filename, "ab" if written else "wb") as f:
+                    async for chunk in r.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        written += len(chunk)
+                        if written > MAX_IMAGE_BYTES:
+                            raise DownloadTooLarge(f"more than MAX_IMAGE_BYTES={MAX_IMAGE_BYTES} bytes")
+                        sha256_hash.update(chunk)
+                        DOWNLOADED_BYTES.inc(len(chunk))
+                        await f.write(chunk)
+            log.info(f"Saved {filename} ({written} bytes)")
+            return filename, sha256_hash.hexdigest()
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in (416, 429) or e.response.status_code >= 500
+            if not retryable or attempt == DOWNLOAD_RETRIES:
+                log.warning(f"Download failed for {url}: {e}")
+                break
+            delay = 2 ** attempt
+            log.warning(f"Download attempt {attempt} for {url} failed ({e}); resuming at byte {written} in {delay}s")
+            await asyncio.sleep(delay)
+        except Exception as e:
+            log.warning(f"Download failed for {url}: {e}")
+            break
+
+    if os.path.exists(filename):
+        await async_os.remove(filename)
+    return None, None
+
+
+# --- Pre-flight ---
+async def read_head(url, limit):
+    """GET at most limit bytes of url; return (status, full size or None, content type, bytes)."""
+    data = bytearray()
+    async with get_http_client().stream("GET", url, headers={"Range": f"bytes=0-{limit - 1}"}) as r:
+        if r.status_code < 400:
+            async for chunk in r.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                data += chunk
+                if len(data) >= limit:
+                    break
+        total = None
+        if r.status_code == 206:
+            size = r.headers.get("Content-Range", "").rpartition("/")[2]
+            total = int(size) if size.isdigit() else None
+        elif r.status_code == 200 and r.headers.get("Content-Length", "").isdigit():
+            total = int(r.headers["Content-Length"])
+    DOWNLOADED_BYTES.inc(len(data))
+    return r.status_code, total, r.headers.get("Content-Type", ""), bytes(data[:limit])
+
+
+async def preflight_image(url):
+    """Check the first bytes of url; return rejection reasons, or None to go ahead with the download.
+
+    Only definite problems reject: a client error, a body that isn't an image,
+    or a size or resolution over the limits. Anything inconclusive (network or
+    server errors, a header cut short) leaves the decision to the download.
+    """
+    import httpx
+
     try:
-        async with httpx.AsyncClient(timeout=60) as client:
-            r = await client.get(url)
-            r.raise_for_status()
-            async with aiofiles.open(filename, "wb") as f:
-                await f.write(r.content)
-        log.info(f"Saved {filename}")
-        return filename
-    except Exception as e:
-        log.warning(f"Download failed for {url}: {e}")
+        status, total, content_type, head = await read_head(url, PREFLIGHT_BYTES)
+    except httpx.HTTPError as e:
+        log.info(f"Pre-flight inconclusive for {url}: {e}")
         return None
+    if 400 <= status < 500 and status not in (408, 416, 429):
+        return {"reason": "Broken URL", "status": status}
+    if status >= 400:
+        return None
+    if total and total > MAX_IMAGE_BYTES:
+        return {"reason": "Too large", "bytes": total}
+    dims = read_dimensions(head)
+    if dims is None:
+        if content_type.startswith("image/"):
+            return None  # a format we don't parse
+        return {"reason": "Not an image", "content_type": content_type}
+    _, width, height = dims
+    if width and width * height > MAX_IMAGE_PIXELS:
+        return {"reason": "Too large", "width": width, "height": height}
+    return None
 
 
-# --- Send Wallpaper to Telegram Group ---
-async def send_wallpaper_to_group(client, config):
-    if shutdown_requested:
-        log.warning(f"Skipping send for group {config['id']} (shutdown in progress)")
-        return
+async def preview_duplicate(preview_url):
+    """Hash the small preview variant; return skip reasons if it matches a stored phash."""
+    import httpx
 
-    task = asyncio.current_task()
-    ACTIVE_TASKS.add(task)
+    if not preview_url or PHASH_INDEX is None:
+        return None
     try:
-        group_id = config["id"]
-        categories = config["categories"]
-        log.info(f"Running job for group {group_id} with categories {categories}")
+        status, total, _, data = await read_head(preview_url, PREVIEW_MAX_BYTES)
+    except httpx.HTTPError as e:
+        log.info(f"Preview fetch failed for {preview_url}: {e}")
+        return None
+    if status >= 400 or (total and total > PREVIEW_MAX_BYTES):
+        return None
+    loop = asyncio.get_running_loop()
+    p_hash = await loop.run_in_executor(HASH_EXECUTOR, compute_phash, io.BytesIO(data))
+    value = parse_hash(p_hash) if p_hash else None
+    diff = PHASH_INDEX.find_within(value, PREVIEW_SIMILARITY) if value is not None else None
+    if diff is None:
+        return None
+    return {**similar_reasons(diff), "source": "preview"}
+
+
+async def preflight_wallpaper(wallpaper):
+    """(status, reasons) for a wallpaper that can be ruled out without downloading it, else None."""
+    reasons = await preflight_image(wallpaper["image_url"])
+    if reasons:
+        return "failed", reasons
+    if "enriched_at" in wallpaper:
+        return None  # already dedup-checked, and its own phash is in the index
+    reasons = await preview_duplicate(wallpaper.get("preview_url"))
+    if reasons:
+        return "skipped", reasons
+    return None
+
+
+# --- Candidate preparation ---
+async def prepare_wallpaper(categories):
+    """Pick one pending wallpaper, pre-flight check it, then download, hash and dedup-check it.
+
+    Wallpapers enrich.py has already hashed and kept skip the dedup check, as
+    long as the download still matches the stored SHA-256.
+
+    Returns a ready candidate, None if there is no stock left, or "retry" if the
+    pick was a duplicate or failed (its status is recorded either way).
+    """
+    await refresh_phash_index()
+    with STAGE_SECONDS.time(stage="select"):
         wallpaper = await get_random_wallpaper(categories)
-        if not wallpaper:
-            return
+    if not wallpaper:
+        return None
+
+    jpg_url = wallpaper["image_url"]
+    RESERVED_URLS.add(jpg_url)
+    path = None
+    try:
+        if PREFLIGHT:
+            with STAGE_SECONDS.time(stage="preflight"):
+                rejected = await preflight_wallpaper(wallpaper)
+            if rejected:
+                log.info(f"Pre-flight ruled out {jpg_url}: {rejected[1]}")
+                await update_wallpaper_status(jpg_url, *rejected)
+                RESERVED_URLS.discard(jpg_url)
+                return "retry"
 
-        jpg_url = wallpaper["image_url"]
         tags = wallpaper.get("tags", [])
         caption = " ".join([f"#{t.replace(' ', '')}" for t in tags]) if tags else "#wallpaper"
         category = wallpaper.get("category", "wallpaper")
         filename = f"{category}_{random.randint(1000,9999)}_{os.path.basename(urlparse(jpg_url).path)}"
 
-        path = await download_image(jpg_url, filename)
+        with STAGE_SECONDS.time(stage="download"):
+            path, sha256 = await download_image(jpg_url, filename)
         if not path:
             await update_wallpaper_status(jpg_url, "failed", {"reason": "Download failed"})
-            return
+            RESERVED_URLS.discard(jpg_url)
+            return "retry"
 
-        sha256, phash = calculate_hashes(path)
+        vetted = "enriched_at" in wallpaper and sha256 == wallpaper.get("sha256")
+        if vetted:
+            phash = wallpaper.get("phash")
+        else:
+            with STAGE_SECONDS.time(stage="phash"):
+                phash = await calculate_phash(path)
         if not sha256 or not phash:
             await update_wallpaper_status(jpg_url, "failed", {"reason": "Hashing failed"})
             await async_os.remove(path)
-            return
+            RESERVED_URLS.discard(jpg_url)
+            return "retry"
 
-        status_check, reasons = await check_image_hashes_in_data(sha256, phash)
-        if status_check == "skipped":
-            await update_wallpaper_status(jpg_url, "skipped", reasons, sha256, phash)
-            await async_os.remove(path)
+        candidate = {
+            "jpg_url": jpg_url, "caption": caption, "path": path, "sha256": sha256, "phash": phash, "vetted": vetted,
+            "own_phash": wallpaper.get("phash") if "enriched_at" in wallpaper else None,
+        }
+        if not await vet_candidate(candidate):
+            return "retry"
+        return candidate
+    except BaseException:
+        RESERVED_URLS.discard(jpg_url)
+        if path and os.path.exists(path):
+            os.remove(path)
+        raise
+
+
+async def vet_candidate(candidate):
+    """Dedup-check a downloaded candidate; record and discard it if it's a duplicate."""
+    if candidate["vetted"]:
+        return True
+    with STAGE_SECONDS.time(stage="dedup"):
+        status_check, reasons = await check_image_hashes_in_data(
+            candidate["sha256"], candidate["phash"], candidate["jpg_url"], candidate["own_phash"])
+    if status_check == "skipped":
+        await update_wallpaper_status(candidate["jpg_url"], "skipped", reasons, candidate["sha256"], candidate["phash"])
+        await discard_candidate(candidate)
+        return False
+    return True
+
+
+async def discard_candidate(candidate):
+    if os.path.exists(candidate["path"]):
+        await async_os.remove(candidate["path"])
+    RESERVED_URLS.discard(candidate["jpg_url"])
+
+
+async def prepare_candidate(categories):
+    """Keep drawing until a wallpaper passes dedup (None when stock runs out)."""
+    for _ in range(PREPARE_ATTEMPTS):
+        candidate = await prepare_wallpaper(categories)
+        if candidate != "retry":
+            return candidate
+    log.warning(f"No usable wallpaper for {categories} after {PREPARE_ATTEMPTS} attempts")
+    return None
+
+
+# --- Prefetch ---
+async def prefetch_worker(config):
+    """Keep up to PREFETCH_DEPTH vetted candidates ready for one group.
+
+    A slot is taken before preparing and given back when the sender takes a
+    candidate, so duplicates are replaced in the background without ever
+    holding more than PREFETCH_DEPTH downloads per group.
+    """
+    queue, slots = PREFETCH_QUEUES[config["id"]]
+    while not shutdown_requested:
+        await slots.acquire()
+        try:
+            candidate = await prepare_candidate(config["categories"])
+        except Exception as e:
+            log.error(f"Prefetch error for group {config['id']}: {e}")
+            candidate = None
+        if candidate is None:
+            slots.release()
+            await asyncio.sleep(PREFETCH_IDLE_SECONDS)
+            continue
+        log.info(f"Prefetched {candidate['jpg_url']} for group {config['id']}")
+        queue.put_nowait(candidate)
+
+
+async def take_prefetched(config):
+    """Pop a prefetched candidate and re-vet it (another group may have posted a look-alike)."""
+    if config["id"] not in PREFETCH_QUEUES:
+        return None
+    queue, slots = PREFETCH_QUEUES[config["id"]]
+    while not queue.empty():
+        candidate = queue.get_nowait()
+        slots.release()
+        try:
+            vetted = await vet_candidate(candidate)
+        except BaseException:
+            # Off the queue now, so nothing else would remove its file or reservation.
+            await discard_candidate(candidate)
+            raise
+        if vetted:
+            return candidate
+    return None
+
+
+def start_prefetch(configs):
+    tasks = []
+    if PREFETCH_DEPTH <= 0:
+        return tasks
+    for cfg in configs:
+        PREFETCH_QUEUES[cfg["id"]] = (asyncio.Queue(), asyncio.Semaphore(PREFETCH_DEPTH))
+        tasks.append(asyncio.create_task(prefetch_worker(cfg)))
+    return tasks
+
+
+async def stop_prefetch(tasks):
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for queue, _ in PREFETCH_QUEUES.values():
+        while not queue.empty():
+            await discard_candidate(queue.get_nowait())
+
+
+# --- Send Wallpaper to Telegram Group ---
+def fits_photo_limits(filepath):
+    """Whether Telegram will take the file as a photo as-is (else Telethon must downscale it)."""
+    from PIL import Image
+
+    try:
+        if os.path.getsize(filepath) > TG_PHOTO_MAX_BYTES:
+            return False
+        with Image.open(filepath) as img:
+            w, h = img.size
+        return w + h <= TG_PHOTO_MAX_SIDE_SUM and max(w, h) <= 20 * min(w, h)
+    except Exception:
+        return False
+
+
+async def post_wallpaper(client, group_id, path, caption):
+    """Send the compressed preview and the HD document, uploading the file only once.
+
+    The bytes go up once through upload_file and both messages reference the
+    uploaded handle. Images Telegram would reject as a photo (too big or extreme
+    dimensions) still get a downscaled preview from Telethon, but the full-size
+    file is uploaded once either way.
+    """
+    from telethon.errors import FloodWaitError
+
+    uploaded = await client.upload_file(path)
+    loop = asyncio.get_running_loop()
+    if await loop.run_in_executor(HASH_EXECUTOR, fits_photo_limits, path):
+        preview = await client.send_file(group_id, uploaded, caption=caption, force_document=False)
+    else:
+        preview = await client.send_file(group_id, path, caption=caption, force_document=False)
+    if HD_SEND_DELAY:
+        await asyncio.sleep(HD_SEND_DELAY)
+    while True:
+        try:
+            hd = await client.send_file(group_id, uploaded, caption="HD Download", force_document=True)
+            return preview, hd
+        except FloodWaitError as e:
+            # The preview is already out: finish the pair, however many waits it takes,
+            # rather than let the dispatcher repost both later.
+            log.warning(f"FloodWait of {e.seconds}s before the HD send to {group_id}, waiting it out")
+            FLOOD_WAITS.inc()
+            UPLOAD_BUDGET.pause(e.seconds)
+            await asyncio.sleep(e.seconds)
+
+
+@contextmanager
+def send_flood_threshold(client):
+    """Lower client.flood_sleep_threshold to FLOOD_SLEEP_THRESHOLD while any post is sending.
+
+    Posts overlap, so the client's own value is saved by the first one in and
+    restored by the last one out.
+    """
+    global SENDS_IN_FLIGHT, CLIENT_FLOOD_THRESHOLD
+    if SENDS_IN_FLIGHT == 0:
+        CLIENT_FLOOD_THRESHOLD = client.flood_sleep_threshold
+        client.flood_sleep_threshold = FLOOD_SLEEP_THRESHOLD
+    SENDS_IN_FLIGHT += 1
+    try:
+        yield
+    finally:
+        SENDS_IN_FLIGHT -= 1
+        if SENDS_IN_FLIGHT == 0:
+            client.flood_sleep_threshold = CLIENT_FLOOD_THRESHOLD
+
+
+async def send_wallpaper_to_group(client, config):
+    """Post one wallpaper to a group. A FloodWaitError is raised for the dispatcher to reschedule."""
+    global FIRST_POST_LOGGED
+    from telethon.errors import FloodWaitError
+
+    if shutdown_requested:
+        log.warning(f"Skipping send for group {config['id']} (shutdown in progress)")
+        return
+
+    task = asyncio.current_task()
+    ACTIVE_TASKS.add(task)
+    try:
+        group_id = config["id"]
+        categories = config["categories"]
+        log.info(f"Running job for group {group_id} with categories {categories}")
+        candidate = await take_prefetched(config)
+        if candidate is None:
+            candidate = await prepare_candidate(categories)
+        if not candidate:
+            await record_pending_stock(config)
             return
 
+        jpg_url, path = candidate["jpg_url"], candidate["path"]
+        sha256, phash = candidate["sha256"], candidate["phash"]
         try:
             log.info(f"Sending wallpaper to Telegram group {group_id}...")
-            preview = await client.send_file(group_id, path, caption=caption, force_document=False)
-            await asyncio.sleep(5)
-            hd = await client.send_file(group_id, path, caption="HD Download", force_document=True)
-            await update_wallpaper_status(jpg_url, "posted", {"reason": "Success"}, sha256, phash, {"preview": preview.to_dict(), "hd": hd.to_dict()})
+            size = os.path.getsize(path)
+            async with UPLOAD_BUDGET.slot(size):
+                with STAGE_SECONDS.time(stage="send"), send_flood_threshold(client):
+                    preview, hd = await post_wallpaper(client, group_id, path, candidate["caption"])
+            UPLOADED_BYTES.inc(size)
+            if COMPACT_TG_RESPONSE:
+                tg_response = {"preview": summarize_message(preview), "hd": summarize_message(hd)}
+            else:
+                tg_response = {"preview": preview.to_dict(), "hd": hd.to_dict()}
+            await update_wallpaper_status(jpg_url, "posted", {"reason": "Success"}, sha256, phash, tg_response)
             log.info(f"Successfully posted wallpaper {jpg_url}")
+            if not FIRST_POST_LOGGED:
+                FIRST_POST_LOGGED = True
+                log.info(f"Time to first post: {time.monotonic() - START_TIME:.2f}s")
+        except FloodWaitError:
+            # Not the wallpaper's fault: it stays pending and the group is retried later.
+            raise
         except Exception as e:
             await update_wallpaper_status(jpg_url, "failed", {"reason": "Telegram upload failed", "details": str(e)})
             log.error(f"Telegram error for {jpg_url}: {e}")
         finally:
-            if os.path.exists(path):
-                await async_os.remove(path)
+            await discard_candidate(candidate)
+        await record_pending_stock(config)
     finally:
         ACTIVE_TASKS.discard(task)
 
 
+# --- Metrics export ---
+async def record_pending_stock(config):
+    """Refresh the pending-stock gauge for one group (skipped when metrics are off)."""
+    if not (METRICS_PORT or METRICS_FILE):
+        return
+    try:
+        stock = await collection.count_documents({"status": "pending", "category": {"$in": config["categories"]}})
+        PENDING_STOCK.set(stock, group=config["id"])
+    except Exception as e:
+        log.warning(f"Could not count pending stock for group {config['id']}: {e}")
+    write_metrics_file()
+
+
+def write_metrics_file():
+    if not METRICS_FILE:
+        return
+    try:
+        metrics.write_to_file(METRICS_FILE)
+    except OSError as e:
+        log.warning(f"Could not write metrics to {METRICS_FILE}: {e}")
+
+
+# --- Dispatch ---
+class Dispatcher:
+    """Posts for every group, run from one queue ordered by due time.
+
+    Scheduler jobs only submit the group name; DISPATCH_WORKERS workers take
+    the earliest due group and post it, with uploads going through
+    UPLOAD_BUDGET. A group is queued or running at most once (a submit while
+    it is pending is dropped, as max_instances=1 did), and a FloodWait puts it
+    back on the queue for when Telegram allows posting again.
+    """
+
+    def __init__(self, workers=DISPATCH_WORKERS):
+        self.workers = workers
+        self.heap = []
+        self.queued = set()
+        self.running = set()
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = []
+
+    def submit(self, name, delay=0.0):
+        if name in self.queued or name in self.running:
+            log.info(f"Group {name} is already queued or posting, skipping this run.")
+            return False
+        heapq.heappush(self.heap, (time.monotonic() + delay, next(self._seq), name))
+        self.queued.add(name)
+        DISPATCH_QUEUED.set(len(self.heap))
+        self._idle.clear()
+        self._wakeup.set()
+        return True
+
+    async def _next_due(self):
+        while True:
+            wait = None
+            if self.heap:
+                wait = self.heap[0][0] - time.monotonic()
+                if wait <= 0:
+                    name = heapq.heappop(self.heap)[2]
+                    DISPATCH_QUEUED.set(len(self.heap))
+                    return name
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            name = await self._next_due()
+            self.queued.discard(name)
+            self.running.add(name)
+            try:
+                # Its own task, so ACTIVE_TASKS tracks the post rather than this worker.
+                await asyncio.create_task(self.run(name))
+            finally:
+                self.running.discard(name)
+                if not self.heap and not self.running:
+                    self._idle.set()
+
+    async def run(self, name):
+        from telethon.errors import FloodWaitError
+
+        cfg = BOT_GROUPS.get(name)
+        if cfg is None:
+            log.warning(f"Group {name} is no longer configured, skipping.")
+            return
+        try:
+            await send_wallpaper_to_group(TG_CLIENT, cfg)
+        except FloodWaitError as e:
+            log.warning(f"FloodWait of {e.seconds}s posting to group {name}, rescheduling it")
+            FLOOD_WAITS.inc()
+            UPLOAD_BUDGET.pause(e.seconds)
+            self.running.discard(name)
+            self.submit(name, e.seconds)
+        except Exception as e:
+            log.error(f"Post for group {name} failed: {e}")
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def join(self):
+        """Wait until nothing is queued or posting."""
+        await self._idle.wait()
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# --- Scheduling ---
+async def run_group_job(name):
+    """Job entry point for both schedulers: jobs store only the group name and enqueue it."""
+    DISPATCHER.submit(name)
+
+
+def build_persistent_scheduler():
+    from apscheduler.jobstores.mongodb import MongoDBJobStore
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+    jobstore = MongoDBJobStore(database=DB_NAME, collection=JOBSTORE_COLLECTION, host=MONGO_URI)
+    return AsyncIOScheduler(jobstores={"default": jobstore}, timezone=timezone.utc)
+
+
+def sync_jobs(scheduler):
+    """Make the stored jobs match BOT_GROUPS without resetting their next fire times.
+
+    Groups seen for the first time fire immediately, like the initial round of
+    the in-memory scheduler; groups that already have a stored job resume at
+    their persisted next_run_time.
+    """
+    now = datetime.now(timezone.utc)
+    wanted = {f"job_{name}" for name in BOT_GROUPS}
+    for job in scheduler.get_jobs():
+        if job.id not in wanted:
+            log.info(f"Removing stale job {job.id}")
+            job.remove()
+
+    for name, cfg in BOT_GROUPS.items():
+        job_id = f"job_{name}"
+        job = scheduler.get_job(job_id)
+        if job is not None and job.trigger.interval.total_seconds() == cfg["interval_seconds"]:
+            log.info(f"Resuming job {job_id}, next run at {job.next_run_time}")
+            continue
+        next_run_time = job.next_run_time if job is not None else now
+        log.info(f"Scheduling job: {name} -> group={cfg['id']}, interval={cfg['interval_seconds']}s, first run {next_run_time}")
+        scheduler.add_job(
+            run_group_job,
+            "interval",
+            args=[name],
+            seconds=cfg["interval_seconds"],
+            id=job_id,
+            next_run_time=next_run_time,
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=None,
+        )
+
+
+def due_jobs(scheduler, now):
+    return [job for job in scheduler.get_jobs() if job.next_run_time and job.next_run_time <= now]
+
+
+async def run_due_jobs(scheduler, due, now):
+    """Run the due jobs, then advance each one's next_run_time past now."""
+    for job in due:
+        await run_group_job(*job.args)
+    await DISPATCHER.join()
+    for job in due:
+        next_run_time = job.trigger.get_next_fire_time(job.next_run_time, now)
+        while next_run_time and next_run_time <= now:
+            next_run_time = job.trigger.get_next_fire_time(next_run_time, now)
+        job.modify(next_run_time=next_run_time)
+        log.info(f"{job.id} next due at {next_run_time}")
+
+
 # --- Main ---
-async def main():
-    log.info("===== WALLRUNNER BOT STARTING =====")
+async def main(mode="legacy"):
+    global STATUS_WRITER, TG_CLIENT, DISPATCHER, UPLOAD_BUDGET
+    log.info(f"===== WALLRUNNER BOT STARTING ({mode} mode) =====")
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, handle_shutdown)
+
+    if mode == "once":
+        # Check the schedule before paying for Telegram login and the phash index.
+        scheduler = build_persistent_scheduler()
+        scheduler.start(paused=True)
+        sync_jobs(scheduler)
+        now = datetime.now(timezone.utc)
+        due = due_jobs(scheduler, now)
+        log.info(f"{len(due)} of {len(BOT_GROUPS)} groups are due.")
+        if not due:
+            scheduler.shutdown(wait=False)
+            log.info(f"Nothing due, exiting after {time.monotonic() - START_TIME:.2f}s.")
+            return
+
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT)
+        log.info(f"Serving metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
 
     log.info("Step 1: Connecting to MongoDB...")
+    init_mongo()
     await ensure_indexes()
+    await ensure_random_keys()
+    await load_phash_index()
+    STATUS_WRITER = StatusWriter(collection)
+    STATUS_WRITER.start()
     log.info("MongoDB connection verified.")
 
-    log.info("Step 2: Initializing Telegram client...")
-    client = TelegramClient(SESSION, API_ID, API_HASH)
-    await client.start(bot_token=BOT_TOKEN)
-    me = await client.get_me()
-    log.info(f"Connected as Telegram bot: @{me.username} (ID: {me.id})")
+    client = None
+    prefetch_tasks = []
+    try:
+        log.info("Step 2: Initializing Telegram client...")
+        from telethon import TelegramClient
+
+        client = TelegramClient(SESSION, API_ID, API_HASH)
+        await client.start(bot_token=BOT_TOKEN)
+        me = await client.get_me()
+        log.info(f"Connected as Telegram bot: @{me.username} (ID: {me.id})")
+        TG_CLIENT = client
+
+        log.info("Step 3: Setting up scheduler...")
+        UPLOAD_BUDGET = UploadBudget(UPLOADS_IN_FLIGHT, UPLOAD_BYTES_PER_SECOND)
+        DISPATCHER = Dispatcher()
+        DISPATCHER.start()
+        if mode == "once":
+            await run_due_jobs(scheduler, due, now)
+            scheduler.shutdown(wait=False)
+        elif mode == "daemon":
+            scheduler = build_persistent_scheduler()
+            scheduler.start(paused=True)
+            sync_jobs(scheduler)
+            scheduler.resume()
+            prefetch_tasks = start_prefetch(BOT_GROUPS.values())
+            log.info("Daemon running with persisted schedule.")
+        else:
+            scheduler = run_legacy_schedule()
+            prefetch_tasks = start_prefetch(BOT_GROUPS.values())
+
+        if mode != "once":
+            log.info("Bot is fully running and awaiting next intervals.")
+            while not shutdown_requested:
+                await asyncio.sleep(1)
+            scheduler.shutdown(wait=False)
+
+        if ACTIVE_TASKS:
+            log.info(f"Waiting for {len(ACTIVE_TASKS)} active tasks to finish...")
+            await asyncio.gather(*ACTIVE_TASKS)
+    finally:
+        # Also on an error: buffered "posted" statuses must reach Mongo, or those
+        # wallpapers stay pending and get posted again.
+        if DISPATCHER is not None:
+            await DISPATCHER.stop()
+        await stop_prefetch(prefetch_tasks)
+        await STATUS_WRITER.stop()
+        save_phash_snapshot()
+        await close_http_client()
+        write_metrics_file()
+        if client is not None:
+            await client.disconnect()
+    log.info("Bot shutdown complete.")
+
+
+def run_legacy_schedule():
+    """In-memory schedule: every group fires at startup, then on its interval."""
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-    log.info("Step 3: Setting up scheduler...")
     scheduler = AsyncIOScheduler()
     for name, cfg in BOT_GROUPS.items():
         log.info(f"Adding job: {name} -> group={cfg['id']}, interval={cfg['interval_seconds']}s")
         scheduler.add_job(
-            send_wallpaper_to_group,
+            run_group_job,
             "interval",
-            args=[client, cfg],
+            args=[name],
             seconds=cfg["interval_seconds"],
             id=f"job_{name}",
             max_instances=1,
@@ -262,25 +1157,22 @@ async def main():
         )
 
     scheduler.start()
-    log.info("Scheduler started. Running initial jobs immediately...")
-
-    initial_tasks = [send_wallpaper_to_group(client, cfg) for cfg in BOT_GROUPS.values()]
-    await asyncio.gather(*initial_tasks)
-
-    log.info("Bot is fully running and awaiting next intervals.")
-    while not shutdown_requested:
-        await asyncio.sleep(1)
-
-    if ACTIVE_TASKS:
-        log.info(f"Waiting for {len(ACTIVE_TASKS)} active tasks to finish...")
-        await asyncio.gather(*ACTIVE_TASKS)
-
-    await client.disconnect()
-    log.info("Bot shutdown complete.")
+    log.info("Scheduler started. Queueing the initial round for every group...")
+    for name in BOT_GROUPS:
+        DISPATCHER.submit(name)
+    return scheduler
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Post wallpapers to the configured Telegram groups.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--daemon", action="store_true",
+                       help="long-running mode; next fire times are persisted in MongoDB and resumed on restart")
+    group.add_argument("--once", action="store_true",
+                       help="run only the groups that are due on the persisted schedule, then exit")
+    args = parser.parse_args()
+    mode = "daemon" if args.daemon else "once" if args.once else "legacy"
     try:
-        asyncio.run(main())
+        asyncio.run(main(mode))
     except KeyboardInterrupt:
         log.warning("Program interrupted by user.")
@@ -0,0 +1,202 @@
+"""Background enrichment: hash pending wallpapers ahead of posting.
+
+Works through status "pending" documents that have no sha256 yet, in _id
+order. A process pool streams each image and computes its SHA-256 and phash
+(image_hash.compute_phash, as in bot.py). The parent then checks each result
+against everything already hashed, with the bot's rules: the same SHA-256 is
+a "Duplicate", a phash within SIMILARITY_THRESHOLD is "Similar". Duplicates
+are marked skipped, and the rest keep their hashes and an enriched_at stamp.
+The bot posts enriched wallpapers without dedup-checking them again.
+
+Progress is checkpointed after every batch, so an interrupted run picks up
+where it stopped.
+
+    python enrich.py
+    python enrich.py --workers 8 --limit 5000
+    python enrich.py --restart     # ignore the checkpoint (revisits failed downloads)
+"""
+import argparse
+import hashlib
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from pymongo import MongoClient, UpdateOne
+
+from image_hash import DOWNLOAD_CHUNK_SIZE, MAX_IMAGE_BYTES, compute_phash, new_phash_index, similar_reasons
+from phash_index import parse_hash
+from wallpapers_io import load_checkpoint, save_checkpoint
+
+DB_NAME = "prdp"
+COLLECTION_NAME = "wallpapers"
+CHECKPOINT_PATH = "enrich.checkpoint.json"
+BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", 200))
+WORKERS = int(os.getenv("ENRICH_WORKERS", os.cpu_count() or 2))
+FETCH_TIMEOUT = 60
+REPORT_SECONDS = 10
+
+HTTP_CLIENT = None
+
+
+# --- Workers ---
+def init_worker():
+    global HTTP_CLIENT
+    import httpx
+
+    HTTP_CLIENT = httpx.Client(timeout=FETCH_TIMEOUT, follow_redirects=True)
+
+
+def hash_image(url):
+    """Stream url; return (sha256, phash, bytes read, error)."""
+    import httpx
+
+    sha256 = hashlib.sha256()
+    data = io.BytesIO()
+    try:
+        with HTTP_CLIENT.stream("GET", url) as r:
+            r.raise_for_status()
+            for chunk in r.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                sha256.update(chunk)
+                data.write(chunk)
+                if data.tell() > MAX_IMAGE_BYTES:
+                    return None, None, data.tell(), f"more than MAX_IMAGE_BYTES={MAX_IMAGE_BYTES} bytes"
+    except httpx.HTTPError as e:
+        return None, None, data.tell(), str(e) or type(e).__name__
+    data.seek(0)
+    p_hash = compute_phash(data)
+    if p_hash is None:
+        return None, None, data.tell(), "not a decodable image"
+    return sha256.hexdigest(), p_hash, data.tell(), None
+
+
+# --- Dedup ---
+def load_phash_index(coll):
+    """Every stored phash, in the bot's index structure."""
+    index = new_phash_index()
+    for doc in coll.find({"phash": {"$exists": True}}, {"phash": 1, "_id": 0}):
+        index.add_hex(doc["phash"])
+    return index
+
+
+def classify(batch, results, coll, index):
+    """Decide each hashed document of a batch; return {_id: ($set fields)} and the outcome counts.
+
+    Documents are decided in _id order and each kept one is added to the index
+    before the next, so of two look-alikes in the same run the older one is kept.
+    """
+    hashed = [(doc, result) for doc, result in zip(batch, results) if result[3] is None]
+    stored = {}
+    for doc in coll.find({"sha256": {"$in": [result[0] for _, result in hashed]}}, {"sha256": 1, "image_url": 1}):
+        stored.setdefault(doc["sha256"], doc["image_url"])
+
+    now = datetime.now(timezone.utc)
+    updates = {}
+    counts = {"kept": 0, "duplicate": 0, "similar": 0, "failed": len(batch) - len(hashed)}
+    for doc, (sha256, p_hash, _, _) in hashed:
+        fields = {"sha256": sha256, "phash": p_hash, "enriched_at": now, "updated_at": now}
+        value = parse_hash(p_hash)
+        diff = index.find_within(value) if value is not None else None
+        if stored.get(sha256, doc["image_url"]) != doc["image_url"]:
+            fields.update(status="skipped", reasons={"reason": "Duplicate"})
+            counts["duplicate"] += 1
+        elif diff is not None:
+            fields.update(status="skipped", reasons=similar_reasons(diff))
+            counts["similar"] += 1
+        else:
+            counts["kept"] += 1
+        stored.setdefault(sha256, doc["image_url"])
+        if value is not None:
+            index.add(value)
+        updates[doc["_id"]] = fields
+    return updates, counts
+
+
+# --- Run ---
+def pending_query(checkpoint):
+    query = {"status": "pending", "sha256": {"$exists": False}}
+    if checkpoint:
+        query["_id"] = {"$gt": checkpoint["last_id"]}
+    return query
+
+
+def batches(cursor, size):
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def enrich(coll, workers=WORKERS, batch_size=BATCH_SIZE, checkpoint_path=CHECKPOINT_PATH, limit=0):
+    """Hash and dedup pending wallpapers; return the outcome counts."""
+    coll.create_index("sha256")
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint:
+        print(f"Resuming after _id {checkpoint['last_id']}")
+    started = time.monotonic()
+    index = load_phash_index(coll)
+    print(f"Loaded {len(index)} stored phashes in {time.monotonic() - started:.1f}s")
+
+    totals = {"kept": 0, "duplicate": 0, "similar": 0, "failed": 0}
+    done = downloaded = 0
+    started = last_report = time.monotonic()
+    cursor = coll.find(pending_query(checkpoint), {"image_url": 1}).sort("_id", 1)
+    if limit:
+        cursor = cursor.limit(limit)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker) as pool:
+        for batch in batches(cursor, batch_size):
+            results = list(pool.map(hash_image, [doc["image_url"] for doc in batch]))
+            updates, counts = classify(batch, results, coll, index)
+            if updates:
+                # Only while still pending: the bot may have picked one up meanwhile.
+                coll.bulk_write(
+                    [UpdateOne({"_id": _id, "status": "pending"}, {"$set": fields}) for _id, fields in updates.items()],
+                    ordered=False,
+                )
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, {"last_id": batch[-1]["_id"]})
+            for key, n in counts.items():
+                totals[key] += n
+            done += len(batch)
+            downloaded += sum(result[2] for result in results)
+            if time.monotonic() - last_report >= REPORT_SECONDS:
+                last_report = time.monotonic()
+                report(done, downloaded, totals, last_report - started)
+
+    report(done, downloaded, totals, time.monotonic() - started)
+    return totals
+
+
+def report(done, downloaded, totals, elapsed):
+    rate = done / elapsed if elapsed else 0
+    mb_rate = downloaded / 1e6 / elapsed if elapsed else 0
+    print(f"Enriched {done} wallpapers in {elapsed:.1f}s ({rate:.1f} images/s, {mb_rate:.1f} MB/s): "
+          f"{totals['kept']} kept, {totals['duplicate']} duplicate, {totals['similar']} similar, "
+          f"{totals['failed']} failed to download")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hash pending wallpapers and skip duplicates before they are posted.")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="download/hash processes")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many wallpapers (0 = all)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, metavar="FILE",
+                        help=f"resume point, saved after every batch (default: {CHECKPOINT_PATH})")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first pending wallpaper")
+    args = parser.parse_args()
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    # Same .env as the bot; loaded here only, so the spawned workers skip it.
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    mongo_uri = os.getenv("FIREBASE_MONGO_URI", "mongodb://localhost:27017")
+    collection = MongoClient(mongo_uri)[DB_NAME][COLLECTION_NAME]
+    enrich(collection, args.workers, args.batch_size, args.checkpoint, args.limit)
@@ -0,0 +1,72 @@
+"""Persistent HTTP response cache for the scraper, stored in one SQLite file.
+
+Bodies are kept zlib-compressed next to their ETag / Last-Modified validators,
+so a page can be served from disk while fresh and revalidated with a
+conditional request (If-None-Match / If-Modified-Since) once it isn't.
+"""
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+CacheEntry = namedtuple("CacheEntry", ["etag", "last_modified", "fetched_at", "body"])
+
+
+class HttpCache:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, fetched_at REAL NOT NULL, body BLOB NOT NULL)"
+        )
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, fetched_at, body FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, fetched_at, body = row
+        return CacheEntry(etag, last_modified, fetched_at, zlib.decompress(body).decode("utf-8"))
+
+    @staticmethod
+    def is_fresh(entry, ttl):
+        return entry is not None and ttl > 0 and time.time() - entry.fetched_at < ttl
+
+    @staticmethod
+    def validators(entry):
+        """Conditional request headers for a stale entry ({} when there is nothing to revalidate)."""
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def put(self, url, text, headers):
+        body = zlib.compress(text.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, fetched_at, body) VALUES (?, ?, ?, ?, ?)",
+                (url, headers.get("ETag"), headers.get("Last-Modified"), time.time(), body),
+            )
+
+    def touch(self, url):
+        """Mark an entry fresh again after a 304 Not Modified."""
+        with self._lock:
+            self._conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
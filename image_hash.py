@@ -0,0 +1,55 @@
+"""Image hashing and duplicate thresholds shared by bot.py and enrich.py.
+
+Kept free of import-time side effects, so enrich.py's worker processes can
+import it without pulling in the bot.
+"""
+import logging
+import os
+
+from phash_index import MultiIndexHashIndex, PackedHashArray
+
+log = logging.getLogger("wallbot")
+
+# Two phashes less than SIMILARITY_THRESHOLD bits apart are the same picture.
+SIMILARITY_THRESHOLD = 5
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", 50 * 1024 * 1024))
+PHASH_DRAFT_SIZE = 256
+# "numpy" keeps a packed uint64 array (snapshotted for fast cold starts);
+# "multi-index" keeps a band index in plain Python dicts.
+PHASH_BACKEND = os.getenv("PHASH_BACKEND", "numpy")
+
+
+def compute_phash(filepath):
+    """Average hash of an image file (path or file object). CPU-bound: keep it off the event loop."""
+    import imagehash
+    from PIL import Image
+
+    try:
+        with Image.open(filepath) as img:
+            # Let the JPEG decoder downscale (up to 1/8) while decoding, in greyscale:
+            # average_hash shrinks to 8x8 anyway, so the full 4K bitmap is never needed.
+            img.draft("L", (PHASH_DRAFT_SIZE, PHASH_DRAFT_SIZE))
+            p_hash = str(imagehash.average_hash(img))
+        log.debug(f"Computed phash for {filepath}: {p_hash}")
+        return p_hash
+    except Exception as e:
+        log.error(f"Hashing error for {filepath}: {e}")
+        return None
+
+
+def phash_index_class():
+    return PackedHashArray if PHASH_BACKEND == "numpy" else MultiIndexHashIndex
+
+
+def new_phash_index(values=None):
+    """An empty index (or one over values) that matches within SIMILARITY_THRESHOLD."""
+    if values is not None:
+        return phash_index_class().from_values(values, SIMILARITY_THRESHOLD - 1)
+    return phash_index_class()(SIMILARITY_THRESHOLD - 1)
+
+
+def similar_reasons(diff, max_diff=64):
+    similarity = ((max_diff - diff) / max_diff) * 100
+    log.info(f"Similar image found (diff={diff}, {similarity:.1f}% similar)")
+    return {"reason": "Similar", "diff": diff, "similarity": round(similarity, 1)}
@@ -0,0 +1,57 @@
+"""Image format and dimensions from the first bytes of a JPEG or PNG file.
+
+Enough of the file to reach the JPEG frame header (usually a few KB, more when
+large EXIF/ICC segments come first) or the PNG IHDR chunk is all it takes.
+"""
+import struct
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Start-of-frame markers carry the dimensions; C4 (DHT), C8 (JPG) and CC (DAC) don't.
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field.
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+
+def sniff_format(data):
+    if data.startswith(b"\xff\xd8"):
+        return "jpeg"
+    if data.startswith(PNG_SIGNATURE):
+        return "png"
+    return None
+
+
+def read_dimensions(data):
+    """Return (format, width, height), (format, None, None) if the header is cut short, or None."""
+    fmt = sniff_format(data)
+    if fmt == "png":
+        if len(data) >= 24 and data[12:16] == b"IHDR":
+            width, height = struct.unpack(">II", data[16:24])
+            return fmt, width, height
+        return fmt, None, None
+    if fmt == "jpeg":
+        return (fmt, *_jpeg_dimensions(data))
+    return None
+
+
+def _jpeg_dimensions(data):
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None, None
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker == 0xD9 or marker == 0xDA:  # end of image / start of scan: no frame header ahead
+            return None, None
+        (length,) = struct.unpack(">H", data[pos + 2:pos + 4])
+        if marker in JPEG_SOF_MARKERS:
+            if pos + 9 > len(data):
+                return None, None
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None, None
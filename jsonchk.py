@@ -1,14 +1,32 @@
-import json
-
-file = "wallpapers.json"
-with open(file) as f:
-    data = json.load(f)
-
-if isinstance(data, list) and all(isinstance(x, dict) for x in data):
-    print("✅ Ready for mongoimport --jsonArray")
-elif all(line.strip().startswith("{") and line.strip().endswith("}") for line in open(file)):
-    print("✅ Ready for mongoimport (one document per line)")
-elif isinstance(data, dict) and "wallpapers" in data:
-    print("⚠️ Has nested array; extract data['wallpapers'] before importing")
+import sys
+
+from wallpapers_io import InvalidDocument, check_document, iter_documents, open_text
+
+# Streams the file one document at a time (see wallpapers_io), so it works on
+# exports of any size; .gz and .zst files are read transparently.
+file = sys.argv[1] if len(sys.argv) > 1 else "wallpapers.json"
+
+with open_text(file, "r") as f:
+    first = ""
+    count = 0
+    try:
+        for position, doc in iter_documents(f):
+            try:
+                check_document(position, doc)
+            except InvalidDocument as e:
+                print(f"❌ Not compatible with mongoimport structure ({e})")
+                sys.exit(1)
+            first = first or position.split()[0]
+            count += 1
+    except InvalidDocument as e:
+        # Only a parse failure on the first line means the file isn't NDJSON at all.
+        if e.position == "line 1":
+            print("⚠️ Not one document per line; if it has a nested array, extract data['wallpapers'] before importing")
+        else:
+            print(f"❌ Not compatible with mongoimport structure ({e})")
+        sys.exit(1)
+
+if first == "element":
+    print(f"✅ Ready for mongoimport --jsonArray ({count} documents)")
 else:
-    print("❌ Not compatible with mongoimport structure")
+    print(f"✅ Ready for mongoimport (one document per line, {count} documents)")
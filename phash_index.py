@@ -0,0 +1,202 @@
+"""In-memory near-duplicate search over 64-bit perceptual hashes."""
+import json
+import os
+from datetime import datetime
+
+HASH_BITS = 64
+
+
+def parse_hash(hex_hash):
+    """Return a stored phash hex string as an int, or None if it isn't a 64-bit hash."""
+    if not isinstance(hex_hash, str) or len(hex_hash) != HASH_BITS // 4:
+        return None
+    try:
+        return int(hex_hash, 16)
+    except ValueError:
+        return None
+
+
+class MultiIndexHashIndex:
+    """Multi-index hashing over fixed bit bands.
+
+    Each hash is split into ``max_distance + 1`` disjoint bands and filed under
+    every band value. Two hashes within ``max_distance`` bits of each other
+    differ in at most ``max_distance`` bands, so by pigeonhole they agree
+    exactly on at least one; a query only compares against hashes sharing a
+    band with it instead of scanning the whole library.
+    """
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        width, extra = divmod(HASH_BITS, bands)
+        self._bands = []
+        shift = 0
+        for i in range(bands):
+            bits = width + (1 if i < extra else 0)
+            self._bands.append((shift, (1 << bits) - 1))
+            shift += bits
+        self._tables = [{} for _ in self._bands]
+        self._hashes = {}  # value -> how many times it was added
+
+    def __len__(self):
+        return sum(self._hashes.values())
+
+    def add(self, value):
+        if value in self._hashes:
+            self._hashes[value] += 1
+            return
+        self._hashes[value] = 1
+        for (shift, mask), table in zip(self._bands, self._tables):
+            table.setdefault((value >> shift) & mask, []).append(value)
+
+    def add_hex(self, hex_hash):
+        value = parse_hash(hex_hash)
+        if value is not None:
+            self.add(value)
+
+    def find_within(self, value, max_distance=None, exclude=None):
+        """Return the smallest Hamming distance <= max_distance to a stored hash, or None.
+
+        exclude, if given, is a stored hash to leave out once (the querying
+        wallpaper's own, when it is already in the index).
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        if max_distance > self.max_distance:
+            raise ValueError(f"index was built for distances up to {self.max_distance}")
+        skip = exclude if exclude is not None and self._hashes.get(exclude) == 1 else None
+        if value in self._hashes and value != skip:
+            return 0
+        best = None
+        for (shift, mask), table in zip(self._bands, self._tables):
+            for candidate in table.get((value >> shift) & mask, ()):
+                if candidate == skip:
+                    continue
+                diff = (value ^ candidate).bit_count()
+                if diff <= max_distance and (best is None or diff < best):
+                    best = diff
+        return best
+
+    def values(self):
+        return [value for value, count in self._hashes.items() for _ in range(count)]
+
+    @classmethod
+    def from_values(cls, values, max_distance):
+        index = cls(max_distance)
+        for value in values:
+            index.add(int(value))
+        return index
+
+
+class PackedHashArray:
+    """Every known hash in one packed uint64 array.
+
+    A lookup is a single vectorized XOR + popcount over the whole array. The
+    bulk of the array can be a read-only memory map of a snapshot; hashes added
+    afterwards go to a growable tail that is searched alongside it.
+    """
+
+    def __init__(self, max_distance, base=None):
+        import numpy as np
+
+        self.max_distance = max_distance
+        self._base = base if base is not None else np.empty(0, dtype=np.uint64)
+        self._tail = np.empty(1024, dtype=np.uint64)
+        self._tail_len = 0
+
+    def __len__(self):
+        return len(self._base) + self._tail_len
+
+    def add(self, value):
+        import numpy as np
+
+        if self._tail_len == len(self._tail):
+            grown = np.empty(len(self._tail) * 2, dtype=np.uint64)
+            grown[:self._tail_len] = self._tail
+            self._tail = grown
+        self._tail[self._tail_len] = value
+        self._tail_len += 1
+
+    def add_hex(self, hex_hash):
+        value = parse_hash(hex_hash)
+        if value is not None:
+            self.add(value)
+
+    def values(self):
+        import numpy as np
+
+        return np.concatenate([self._base, self._tail[:self._tail_len]])
+
+    def find_within(self, value, max_distance=None, exclude=None):
+        """Return the smallest Hamming distance <= max_distance to a stored hash, or None.
+
+        exclude, if given, is a stored hash to leave out once (the querying
+        wallpaper's own, when it is already in the index).
+        """
+        import numpy as np
+
+        if max_distance is None:
+            max_distance = self.max_distance
+        query = np.uint64(value)
+        best = None
+        for arr in (self._base, self._tail[:self._tail_len]):
+            if not len(arr):
+                continue
+            diffs = _popcount(arr ^ query)
+            if exclude is not None:
+                hits = np.flatnonzero(arr == np.uint64(exclude))
+                if len(hits):
+                    diffs[hits[0]] = HASH_BITS + 1
+                    exclude = None
+            diff = int(diffs.min())
+            if diff <= max_distance and (best is None or diff < best):
+                best = diff
+        return best
+
+    @classmethod
+    def from_values(cls, values, max_distance):
+        return cls(max_distance, base=values)
+
+
+def _popcount(arr):
+    import numpy as np
+
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(arr)
+    table = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    return table[arr.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def distinct_values(*parts):
+    """Every hash in parts once, as a sorted uint64 array."""
+    import numpy as np
+
+    return np.unique(np.concatenate([np.asarray(part, dtype=np.uint64) for part in parts]))
+
+
+def save_snapshot(path, values, saved_at):
+    """Write hashes to ``path`` (.npy) with the time they were current as of."""
+    import numpy as np
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, np.asarray(values, dtype=np.uint64))
+    os.replace(tmp, path)
+    with open(f"{path}.json", "w") as f:
+        json.dump({"count": len(values), "saved_at": saved_at.isoformat()}, f)
+
+
+def load_snapshot(path):
+    """Memory-map a snapshot; return (values, saved_at) or (None, None) if there isn't a usable one."""
+    import numpy as np
+
+    try:
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+        values = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None, None
+    if values.dtype != np.uint64 or len(values) != meta.get("count"):
+        return None, None
+    return values, datetime.fromisoformat(meta["saved_at"])
@@ -0,0 +1,185 @@
+"""Client-side rate control for the scraper and the bot's uploads.
+
+TokenBucket caps the request rate, AimdController adapts how many requests may
+be in flight (additive increase while responses are healthy, multiplicative
+decrease on throttling, 5xx or timeouts), and ThreadGate / AsyncGate combine
+the two for the threaded and asyncio engines. backoff_delay spaces out retries.
+UploadBudget caps the bot's concurrent Telegram uploads and their bytes/second.
+"""
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+
+class TokenBucket:
+    """rate tokens (requests, bytes) per second with bursts of up to burst; a rate <= 0 disables it."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Take tokens and return how many seconds to wait before using them.
+
+        Taking more than burst at once is allowed; the debt is paid off by the
+        wait, so the average rate still holds.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class AimdController:
+    """Additive-increase / multiplicative-decrease concurrency window.
+
+    Each success grows the window by 1/window (about +1 per window's worth of
+    responses); a congestion signal multiplies it by decrease, at most once per
+    cooldown seconds so one burst of errors counts as a single event.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, decrease=0.5, cooldown=1.0):
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.decreases = 0
+        self._last_decrease = float("-inf")
+        self._lock = threading.Lock()
+
+    @property
+    def window(self):
+        return int(self.limit)
+
+    def on_success(self):
+        with self._lock:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_congestion(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self.decreases += 1
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (HTTP-date values are ignored)."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0, retry_after=None):
+    """Full-jitter exponential backoff for the given retry attempt (0-based).
+
+    A Retry-After from the server wins when it asks for longer.
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(cap, retry_after))
+    return delay
+
+
+class ThreadGate:
+    """Admits threads while fewer than the controller's window are in flight."""
+
+    def __init__(self, controller, bucket):
+        self.controller = controller
+        self.bucket = bucket
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            while self.in_flight >= self.controller.window:
+                self._cond.wait()
+            self.in_flight += 1
+        try:
+            wait = self.bucket.reserve()
+            if wait:
+                time.sleep(wait)
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                # Wake as many waiters as the (possibly grown) window has room for.
+                self._cond.notify(max(1, self.controller.window - self.in_flight))
+
+    def on_success(self):
+        self.controller.on_success()
+
+    def on_congestion(self):
+        self.controller.on_congestion()
+
+
+class AsyncGate:
+    """asyncio counterpart of ThreadGate; create it on the loop that uses it."""
+
+    def __init__(self, controller, bucket):
+        self.controller = controller
+        self.bucket = bucket
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.controller.window)
+            self.in_flight += 1
+        try:
+            wait = self.bucket.reserve()
+            if wait:
+                await asyncio.sleep(wait)
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._cond.notify(max(1, self.controller.window - self.in_flight))
+
+    def on_success(self):
+        self.controller.on_success()
+
+    def on_congestion(self):
+        self.controller.on_congestion()
+
+
+class UploadBudget:
+    """Process-wide budget for uploads: at most in_flight at once, bytes_per_second overall.
+
+    pause() holds every new upload back until the deadline; Telegram's
+    FloodWait applies to the whole bot, not to the one chat that hit it.
+    Create it on the loop that uses it.
+    """
+
+    def __init__(self, in_flight, bytes_per_second=0):
+        self.bucket = TokenBucket(bytes_per_second)
+        self.resume_at = 0.0
+        self._slots = asyncio.Semaphore(max(1, in_flight))
+
+    def pause(self, seconds):
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    @asynccontextmanager
+    async def slot(self, size):
+        async with self._slots:
+            while (wait := self.resume_at - time.monotonic()) > 0:
+                await asyncio.sleep(wait)
+            wait = self.bucket.reserve(size)
+            if wait:
+                await asyncio.sleep(wait)
+            yield
@@ -1,29 +1,98 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
+import argparse
+import asyncio
+import importlib.util
+import itertools
 import json
+import multiprocessing
+import random
 import re
 import os
+import threading
+import time
+from html import unescape
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from pymongo import MongoClient, errors
+import httpx
+from datetime import datetime, timezone
+from pymongo import MongoClient, UpdateOne, errors
+import metrics
+from http_cache import HttpCache
+from ratelimit import AimdController, AsyncGate, ThreadGate, TokenBucket, backoff_delay, parse_retry_after
 
 BASE_URL = "https://4kwallpapers.com"
 DB_NAME = "prdp"
 COLLECTION_NAME = "wallpapers"
+STATE_COLLECTION_NAME = "crawl_state"
 MAX_PAGE_WORKERS = 5
 MAX_DETAIL_WORKERS = 100
+# Async engine: ceiling on in-flight requests, with a pool sized to match.
+MAX_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", 64))
+CLIENT_POOL_SIZE = 16
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+USER_AGENT = "Mozilla/5.0 (Mongo Scraper bot)"
+# On-disk HTTP cache, enabled with --cache or SCRAPER_CACHE. Detail pages are served
+# from it for CACHE_DETAIL_TTL seconds; listing pages are always revalidated.
+CACHE_PATH = "scraper_cache.sqlite3"
+CACHE_DETAIL_TTL = int(os.getenv("SCRAPER_CACHE_TTL", 30 * 24 * 3600))
+CACHE = None
+# Fetch layer: requests in flight start at START_CONCURRENCY and adapt (AIMD) up to
+# the engine's ceiling; SCRAPER_RATE optionally caps requests per second (0 = off).
+# 429/5xx/timeouts are retried with jittered backoff, and pages that still fail
+# are queued in FAILED and retried once more at the end of the run.
+FETCH_TIMEOUT = 10
+FETCH_RETRIES = int(os.getenv("SCRAPER_RETRIES", 4))
+START_CONCURRENCY = int(os.getenv("SCRAPER_START_CONCURRENCY", 32))
+RATE_LIMIT = float(os.getenv("SCRAPER_RATE", 0))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+FAILED = {"listing": set(), "detail": set()}
+FAILED_LOCK = threading.Lock()
+
+IMAGE_RE = re.compile(r'/images/wallpapers/[^"]+\.(?:jpe?g|png)', re.IGNORECASE)
+RESOLUTION_RE = re.compile(r'-(\d+)x(\d+)-\d+\.')
+META_TAG_RE = re.compile(r"<meta\b[^>]*>", re.IGNORECASE)
+META_ATTR_RE = re.compile(r"""([^\s=/>"']+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+
+# Written in Prometheus text format at the end of the run when set.
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+PAGES = metrics.REGISTRY.counter("scraper_pages_total", "Pages requested, by kind and result.", ["kind", "result"])
+DETAIL_SECONDS = metrics.REGISTRY.histogram("scraper_detail_fetch_seconds", "Latency of detail page requests.")
+INSERTED = metrics.REGISTRY.counter("scraper_inserted_total", "Wallpapers inserted into MongoDB.")
+PAGES_PER_SECOND = metrics.REGISTRY.gauge("scraper_pages_per_second", "Pages fetched per second over the whole run.")
+RUN_SECONDS = metrics.REGISTRY.gauge("scraper_run_seconds", "Wall-clock duration of the run.")
+CACHE_RESULTS = metrics.REGISTRY.counter("scraper_cache_total", "HTTP cache lookups, by result.", ["result"])
+RETRIES = metrics.REGISTRY.counter("scraper_retries_total", "Requests retried, by cause.", ["reason"])
 
 session = requests.Session()
-session.headers["User-Agent"] = "Mozilla/5.0 (Mongo Scraper bot)"
+session.headers["User-Agent"] = USER_AGENT
+# Every page worker runs its own pool of detail workers on this session, so keep
+# enough connections around for all of them instead of urllib3's default of 10.
+session.mount("https://", HTTPAdapter(pool_maxsize=MAX_PAGE_WORKERS * MAX_DETAIL_WORKERS))
+session.mount("http://", HTTPAdapter(pool_maxsize=MAX_PAGE_WORKERS * MAX_DETAIL_WORKERS))
+GATE = ThreadGate(
+    AimdController(START_CONCURRENCY, maximum=MAX_PAGE_WORKERS * MAX_DETAIL_WORKERS), TokenBucket(RATE_LIMIT)
+)
 
 # --- Mongo setup ---
 MONGO_URI = os.getenv("FIREBASE_MONGO_URI", "mongodb://localhost:27017")
 client = MongoClient(MONGO_URI)
 db = client[DB_NAME]
 collection = db[COLLECTION_NAME]
+# One document per category shard: {_id: category, page, updated_at, finished_at}.
+state_collection = db[STATE_COLLECTION_NAME]
+
+# Categories consumed by the bot, used to pick and prioritise shards.
+try:
+    from bot_config import BOT_GROUPS
+except ImportError:
+    BOT_GROUPS = {}
 
-# Ensure unique entries
-collection.create_index("image_url", unique=True)
-collection.create_index("wallpaper_url", unique=True)
+
+def ensure_indexes():
+    """Ensure unique entries."""
+    collection.create_index("image_url", unique=True)
+    collection.create_index("wallpaper_url", unique=True)
 
 
 def sanitize_tags(raw_tags):
@@ -37,93 +106,411 @@ def sanitize_tags(raw_tags):
     return tags
 
 
-def get_highest_image(url):
-    """Fetch wallpaper page and return highest resolution JPG or PNG URL."""
-    try:
-        html = session.get(url, timeout=10).text
-    except Exception:
-        return None
-
-    matches = re.findall(r'/images/wallpapers/[^"]+\.(?:jpe?g|png)', html, re.IGNORECASE)
-    if not matches:
-        return None
-    full_urls = [BASE_URL + m for m in matches]
-    best = None
+def pick_image_variants(html):
+    """Return the (highest, lowest) resolution JPG or PNG URLs referenced in a wallpaper page."""
+    best = smallest = None
     best_pixels = 0
-    for u in full_urls:
-        m = re.search(r'-(\d+)x(\d+)-\d+\.', u)
-        if m:
-            w, h = map(int, m.groups())
+    smallest_pixels = float("inf")
+    for m in IMAGE_RE.findall(html):
+        size = RESOLUTION_RE.search(m)
+        if size:
+            w, h = map(int, size.groups())
             pixels = w * h
             if pixels > best_pixels:
                 best_pixels = pixels
-                best = u
-    return best
+                best = BASE_URL + m
+            if pixels < smallest_pixels:
+                smallest_pixels = pixels
+                smallest = BASE_URL + m
+    return best, smallest
 
 
-def already_in_db(wallpaper_url, image_url):
-    return collection.find_one({
-        "$or": [
-            {"wallpaper_url": wallpaper_url},
-            {"image_url": image_url}
-        ]
-    }) is not None
+def extract_keywords(html):
+    """Return the raw content of <meta name="keywords">, or None if absent.
+
+    The fast path scans <meta> tags with a regex instead of building a full
+    BeautifulSoup tree; anything it can't read confidently falls back to the parser.
+    """
+    for tag in META_TAG_RE.findall(html):
+        attrs = {}
+        for name, dq, sq, bare in META_ATTR_RE.findall(tag):
+            attrs[name.lower()] = dq or sq or bare
+        if attrs.get("name") != "keywords":
+            continue
+        if "content" in attrs:
+            return unescape(attrs["content"])
+        break
+
+    soup = BeautifulSoup(html, "html.parser")
+    meta = soup.find("meta", {"name": "keywords"})
+    return meta["content"] if meta else None
+
+
+def parse_wallpaper_page(html):
+    """Extract (tags, image_url, preview_url) from an already fetched wallpaper page.
+
+    preview_url is the smallest resolution on offer, or None if there is only one.
+    """
+    image_url, smallest = pick_image_variants(html)
+    if not image_url:
+        return [], None, None
+    keywords = extract_keywords(html)
+    tags = sanitize_tags(keywords) if keywords else []
+    return tags, image_url, smallest if smallest != image_url else None
+
+
+def listing_url(page_num, category=None):
+    """The global listing (/?page=N), or one category's listing (/<category>/?page=N)."""
+    if page_num == 1:
+        return f"{BASE_URL}/{category}/" if category else BASE_URL
+    return f"{BASE_URL}/{category}/?page={page_num}" if category else f"{BASE_URL}/?page={page_num}"
+
+
+def parse_listing(html):
+    soup = BeautifulSoup(html, "html.parser")
+    return [a["href"] for a in soup.select("a.wallpapers__canvas_image")]
+
+
+def build_wallpaper_doc(wallpaper_url, html):
+    tags, image_url, preview_url = parse_wallpaper_page(html)
+    if not image_url:
+        return None
+    doc = {
+        "category": wallpaper_url.split("/")[3],
+        "wallpaper_url": wallpaper_url,
+        "image_url": image_url,
+        "tags": tags,
+    }
+    if preview_url:
+        # A small variant the bot can hash before committing to the full download.
+        doc["preview_url"] = preview_url
+    return doc
+
+
+def wallpaper_url_for(href):
+    return href if href.startswith("http") else BASE_URL + href
+
+
+class FetchError(Exception):
+    """A page still failed after FETCH_RETRIES retries."""
+
+
+def record_failure(kind, key):
+    with FAILED_LOCK:
+        FAILED[kind].add(key)
+
+
+def request(url, headers=None):
+    """GET url through GATE, retrying throttling, 5xx and transport errors with backoff."""
+    for attempt in range(FETCH_RETRIES + 1):
+        retry_after = None
+        with GATE.slot():
+            try:
+                r = session.get(url, timeout=FETCH_TIMEOUT, headers=headers)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error, reason = e, "timeout" if isinstance(e, requests.Timeout) else "connection"
+            else:
+                if r.status_code not in RETRYABLE_STATUS:
+                    GATE.on_success()
+                    return r
+                error, reason = f"HTTP {r.status_code}", str(r.status_code)
+                retry_after = parse_retry_after(r.headers.get("Retry-After"))
+        GATE.on_congestion()
+        if attempt < FETCH_RETRIES:
+            RETRIES.inc(reason=reason)
+            time.sleep(backoff_delay(attempt, retry_after=retry_after))
+    raise FetchError(f"{url}: {error}")
+
+
+def cached_response(url, entry, status, text, headers):
+    """Resolve a (possibly conditional) response against CACHE and return the page body."""
+    if status == 304 and entry is not None:
+        CACHE_RESULTS.inc(result="not_modified")
+        CACHE.touch(url)
+        return entry.body
+    CACHE_RESULTS.inc(result="miss")
+    if status == 200:
+        CACHE.put(url, text, headers)
+    return text
+
+
+def fetch_html(url, ttl=0):
+    """GET url as text, going through CACHE when it is enabled.
+
+    A cached copy younger than ttl seconds is returned without a request;
+    otherwise the request carries its validators and a 304 reuses the body.
+    """
+    if CACHE is None:
+        return request(url).text
+    entry = CACHE.get(url)
+    if CACHE.is_fresh(entry, ttl):
+        CACHE_RESULTS.inc(result="fresh")
+        return entry.body
+    r = request(url, headers=CACHE.validators(entry))
+    return cached_response(url, entry, r.status_code, r.text, r.headers)
 
 
 def fetch_wallpaper_details(href):
-    wallpaper_url = href if href.startswith("http") else BASE_URL + href
-    category = wallpaper_url.split("/")[3]
+    wallpaper_url = wallpaper_url_for(href)
     try:
-        html2 = session.get(wallpaper_url, timeout=10).text
-        soup2 = BeautifulSoup(html2, "html.parser")
-        meta = soup2.find("meta", {"name": "keywords"})
-        tags = sanitize_tags(meta["content"]) if meta else []
-        image_url = get_highest_image(wallpaper_url)
-        if not image_url:
-            return None
-        return {
-            "category": category,
-            "wallpaper_url": wallpaper_url,
-            "image_url": image_url,
-            "tags": tags,
-        }
+        with DETAIL_SECONDS.time():
+            html = fetch_html(wallpaper_url, CACHE_DETAIL_TTL)
+        PAGES.inc(kind="detail", result="ok")
+        return build_wallpaper_doc(wallpaper_url, html)
     except Exception as e:
+        PAGES.inc(kind="detail", result="error")
+        if isinstance(e, FetchError):
+            record_failure("detail", href)
         print(f"[ERROR] {wallpaper_url}: {e}")
         return None
 
 
-def scrape_page(page_num):
-    url = BASE_URL if page_num == 1 else f"{BASE_URL}/?page={page_num}"
+def fetch_listing(page_num, category=None):
+    """Return the wallpaper hrefs on one listing page ([] if it can't be fetched)."""
+    url = listing_url(page_num, category)
     print(f"=== Scraping {url} ===")
     try:
-        html = session.get(url, timeout=10).text
+        html = fetch_html(url)
     except Exception as e:
+        PAGES.inc(kind="listing", result="error")
+        if isinstance(e, FetchError):
+            record_failure("listing", (page_num, category))
         print(f"[ERROR] Failed to fetch page {url}: {e}")
         return []
+    PAGES.inc(kind="listing", result="ok")
+    return parse_listing(html)
 
-    soup = BeautifulSoup(html, "html.parser")
-    links = [a["href"] for a in soup.select("a.wallpapers__canvas_image")]
 
-    new_items = []
+def fetch_details(links):
+    results = []
     with ThreadPoolExecutor(max_workers=MAX_DETAIL_WORKERS) as executor:
         futures = [executor.submit(fetch_wallpaper_details, href) for href in links]
         for future in as_completed(futures):
             result = future.result()
-            if not result:
-                continue
-            if already_in_db(result["wallpaper_url"], result["image_url"]):
-                continue
+            if result:
+                results.append(result)
+    return results
+
+
+def scrape_page(page_num, category=None):
+    """Fetch one listing page and all of its detail pages; return the parsed documents."""
+    return fetch_details(fetch_listing(page_num, category))
+
+
+def crawl_batch(page_nums, category=None):
+    results = []
+    with ThreadPoolExecutor(max_workers=MAX_PAGE_WORKERS) as executor:
+        futures = {executor.submit(scrape_page, p, category): p for p in page_nums}
+        for future in as_completed(futures):
+            results.extend(future.result())
+    return results
+
+
+# --- Async engine ---
+async def request_async(client, gate, url, headers=None):
+    """Async counterpart of request, admitted through an AsyncGate."""
+    for attempt in range(FETCH_RETRIES + 1):
+        retry_after = None
+        async with gate.slot():
             try:
-                collection.insert_one(result)
-                new_items.append(result)
-                print(f"Inserted: {result['wallpaper_url']}")
-            except errors.DuplicateKeyError:
-                pass
+                r = await client.get(url, headers=headers)
+            except httpx.TransportError as e:
+                error, reason = e, "timeout" if isinstance(e, httpx.TimeoutException) else "connection"
+            else:
+                if r.status_code not in RETRYABLE_STATUS:
+                    gate.on_success()
+                    return r
+                error, reason = f"HTTP {r.status_code}", str(r.status_code)
+                retry_after = parse_retry_after(r.headers.get("Retry-After"))
+        gate.on_congestion()
+        if attempt < FETCH_RETRIES:
+            RETRIES.inc(reason=reason)
+            await asyncio.sleep(backoff_delay(attempt, retry_after=retry_after))
+    raise FetchError(f"{url}: {error!r}")
+
+
+async def fetch_html_async(client, gate, url, ttl=0):
+    """Async counterpart of fetch_html; only real requests go through the gate."""
+    entry = None
+    if CACHE is not None:
+        entry = CACHE.get(url)
+        if CACHE.is_fresh(entry, ttl):
+            CACHE_RESULTS.inc(result="fresh")
+            return entry.body
+    r = await request_async(client, gate, url, headers=CACHE.validators(entry) if CACHE is not None else None)
+    if CACHE is None:
+        return r.text
+    return cached_response(url, entry, r.status_code, r.text, r.headers)
+
+
+async def fetch_wallpaper_details_async(client, gate, href):
+    wallpaper_url = wallpaper_url_for(href)
+    try:
+        with DETAIL_SECONDS.time():
+            html = await fetch_html_async(client, gate, wallpaper_url, CACHE_DETAIL_TTL)
+        PAGES.inc(kind="detail", result="ok")
+        return build_wallpaper_doc(wallpaper_url, html)
+    except Exception as e:
+        PAGES.inc(kind="detail", result="error")
+        if isinstance(e, FetchError):
+            record_failure("detail", href)
+        print(f"[ERROR] {wallpaper_url}: {e}")
+        return None
+
+
+async def fetch_listing_async(client, gate, page_num, category=None):
+    url = listing_url(page_num, category)
+    print(f"=== Scraping {url} ===")
+    try:
+        html = await fetch_html_async(client, gate, url)
+    except Exception as e:
+        PAGES.inc(kind="listing", result="error")
+        if isinstance(e, FetchError):
+            record_failure("listing", (page_num, category))
+        print(f"[ERROR] Failed to fetch page {url}: {e}")
+        return []
+    PAGES.inc(kind="listing", result="ok")
+    return parse_listing(html)
+
+
+async def fetch_details_async(client, gate, links):
+    details = await asyncio.gather(*(fetch_wallpaper_details_async(client, gate, href) for href in links))
+    return [d for d in details if d]
+
+
+async def scrape_page_async(client, gate, page_num, category=None):
+    links = await fetch_listing_async(client, gate, page_num, category)
+    return await fetch_details_async(client, gate, links)
+
+
+async def crawl_batch_async(client, gate, page_nums, category=None):
+    pages = await asyncio.gather(*(scrape_page_async(client, gate, p, category) for p in page_nums))
+    return [doc for page in pages for doc in page]
+
+
+class ClientPool:
+    """Round-robins requests over a few small httpx.AsyncClient pools.
+
+    httpcore walks every pooled connection each time it assigns a request, so a
+    single large pool turns CPU-bound long before the network is saturated.
+    Splitting the same connection budget across clients of CLIENT_POOL_SIZE keeps
+    the per-request bookkeeping flat.
+    """
+
+    def __init__(self, max_connections):
+        sizes = [CLIENT_POOL_SIZE] * (max_connections // CLIENT_POOL_SIZE)
+        if max_connections % CLIENT_POOL_SIZE:
+            sizes.append(max_connections % CLIENT_POOL_SIZE)
+        self.clients = [
+            httpx.AsyncClient(
+                headers={"User-Agent": USER_AGENT},
+                timeout=FETCH_TIMEOUT,
+                follow_redirects=True,
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+            )
+            for size in sizes
+        ]
+        self._next = itertools.cycle(self.clients)
+
+    async def get(self, url, **kwargs):
+        return await next(self._next).get(url, **kwargs)
+
+    async def aclose(self):
+        for client in self.clients:
+            await client.aclose()
+
+
+class AsyncEngine:
+    """Runs crawl batches on a private event loop with pooled, keep-alive connections.
+
+    A single AsyncGate admits every in-flight request (listing and detail pages
+    alike), adapting up to max_concurrency, and the connection pools add up to
+    that ceiling, so connections are reused instead of being torn down between
+    requests.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY):
+        self.loop = asyncio.new_event_loop()
+        self.gate = AsyncGate(
+            AimdController(min(START_CONCURRENCY, max_concurrency), maximum=max_concurrency), TokenBucket(RATE_LIMIT)
+        )
+        self.client = ClientPool(max_concurrency)
+
+    def crawl_batch(self, page_nums, category=None):
+        return self.loop.run_until_complete(crawl_batch_async(self.client, self.gate, page_nums, category))
+
+    def fetch_listing(self, page_num, category=None):
+        return self.loop.run_until_complete(fetch_listing_async(self.client, self.gate, page_num, category))
+
+    def fetch_details(self, links):
+        return self.loop.run_until_complete(fetch_details_async(self.client, self.gate, links))
+
+    def close(self):
+        self.loop.run_until_complete(self.client.aclose())
+        self.loop.close()
+
+
+def save_new_items(results, coll=None):
+    """Store the wallpapers from one crawl batch that aren't in Mongo yet.
+
+    One $in lookup over both unique keys finds what is already stored, then a
+    single unordered bulk_write upserts the rest. The unique indexes catch
+    anything another writer inserted in between.
+    """
+    coll = collection if coll is None else coll
+    batch = {}
+    images = set()
+    for result in results:
+        if result["wallpaper_url"] in batch or result["image_url"] in images:
+            continue
+        batch[result["wallpaper_url"]] = result
+        images.add(result["image_url"])
+    if not batch:
+        return []
+
+    known_urls, known_images = set(), set()
+    for doc in coll.find(
+        {"$or": [
+            {"wallpaper_url": {"$in": list(batch)}},
+            {"image_url": {"$in": list(images)}},
+        ]},
+        {"wallpaper_url": 1, "image_url": 1, "_id": 0},
+    ):
+        known_urls.add(doc.get("wallpaper_url"))
+        known_images.add(doc.get("image_url"))
+    fresh = [r for r in batch.values() if r["wallpaper_url"] not in known_urls and r["image_url"] not in known_images]
+
+    duplicates = 0
+    upserted = {}
+    if fresh:
+        # "rand" is the random key the bot seeks on to pick pending wallpapers.
+        ops = [
+            UpdateOne({"wallpaper_url": r["wallpaper_url"]}, {"$setOnInsert": {**r, "rand": random.random()}}, upsert=True)
+            for r in fresh
+        ]
+        try:
+            upserted = coll.bulk_write(ops, ordered=False).upserted_ids
+        except errors.BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in write_errors):
+                raise
+            duplicates = len(write_errors)
+            upserted = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
+
+    new_items = [fresh[i] for i in sorted(upserted)]
+    INSERTED.inc(len(new_items))
+    print(f"Batch: {len(results)} fetched, {len(batch) - len(fresh)} already stored, "
+          f"{len(new_items)} inserted, {duplicates} duplicate keys")
     return new_items
 
 
-def main():
-    page = 1
+def crawl(fetch_batch, start_page=1, on_batch=None):
+    """Crawl listing batches from start_page until several batches bring nothing new.
+
+    on_batch(next_page) is called after every batch, e.g. to persist a cursor.
+    """
+    page = start_page
     total_new = 0
     consecutive_skips = 0
 
@@ -131,13 +518,7 @@ def main():
         page_batch = [page + i for i in range(MAX_PAGE_WORKERS)]
         print(f"\n>>> Processing pages {page}–{page + MAX_PAGE_WORKERS - 1}")
 
-        all_new = []
-        with ThreadPoolExecutor(max_workers=MAX_PAGE_WORKERS) as executor:
-            futures = {executor.submit(scrape_page, p): p for p in page_batch}
-            for future in as_completed(futures):
-                new_items = future.result()
-                if new_items:
-                    all_new.extend(new_items)
+        all_new = save_new_items(fetch_batch(page_batch))
 
         if not all_new:
             consecutive_skips += 1
@@ -150,9 +531,318 @@ def main():
             print(f"Saved {len(all_new)} new wallpapers to MongoDB.")
 
         page += MAX_PAGE_WORKERS
+        if on_batch:
+            on_batch(page)
+
+    print(f"\n=== Done! Total new wallpapers: {total_new} ===")
+    return total_new
+
+
+def load_seen_urls(coll=None, category=None):
+    """Load every stored wallpaper_url (of one category, if given) as the incremental crawl's seen-set."""
+    coll = collection if coll is None else coll
+    query = {"category": category} if category else {}
+    cursor = coll.find(query, {"wallpaper_url": 1, "_id": 0}).batch_size(10000)
+    return {doc["wallpaper_url"] for doc in cursor if "wallpaper_url" in doc}
+
+
+def crawl_incremental(fetch_listing, fetch_details, seen, category=None):
+    """Walk listing pages newest-first and stop at the first one we already know.
+
+    Hrefs are checked against the seen-set before any detail page is requested,
+    so a run with nothing new costs a single listing fetch.
+    """
+    page = 1
+    total_new = 0
+
+    while True:
+        links = fetch_listing(page, category)
+        if not links:
+            failed = (page, category) in FAILED["listing"]
+            print(f"Page {page} {'could not be fetched' if failed else 'has no wallpapers'}. Stopping.")
+            break
+        fresh = [href for href in links if wallpaper_url_for(href) not in seen]
+        if not fresh:
+            print(f"Page {page} is fully known. Stopping.")
+            break
+
+        print(f"\n>>> Page {page}: {len(fresh)} of {len(links)} wallpapers not seen before")
+        new_items = save_new_items(fetch_details(fresh))
+        total_new += len(new_items)
+        # Detail pages that failed stay unseen, so retry_failed still picks them up.
+        with FAILED_LOCK:
+            failed = set(FAILED["detail"])
+        seen.update(wallpaper_url_for(href) for href in links if href not in failed)
+        page += 1
 
     print(f"\n=== Done! Total new wallpapers: {total_new} ===")
+    return total_new
+
+
+def retry_failed(fetch_listing, fetch_details, seen=None):
+    """Give every page that still failed during the crawl one more pass.
+
+    By now the server has had time to recover; listing pages are re-read for
+    their detail links, and whatever fails again is reported, not retried.
+    """
+    with FAILED_LOCK:
+        pages, hrefs = sorted(FAILED["listing"], key=lambda key: (key[1] or "", key[0])), set(FAILED["detail"])
+        FAILED["listing"].clear()
+        FAILED["detail"].clear()
+    if not pages and not hrefs:
+        return 0
+    print(f"\n>>> Retrying {len(pages)} listing and {len(hrefs)} detail pages that failed")
+    for page, category in pages:
+        hrefs.update(fetch_listing(page, category))
+    if seen is not None:
+        hrefs = {href for href in hrefs if wallpaper_url_for(href) not in seen}
+    new_items = save_new_items(fetch_details(sorted(hrefs))) if hrefs else []
+    print(f"Recovered {len(new_items)} new wallpapers; {len(FAILED['listing'])} listing and "
+          f"{len(FAILED['detail'])} detail pages still failing.")
+    return len(new_items)
+
+
+# --- Category shards ---
+def group_categories():
+    """Every category some BOT_GROUPS entry posts from."""
+    return sorted({c for cfg in BOT_GROUPS.values() for c in cfg["categories"]})
+
+
+def select_shard(categories, shard_index=0, shard_count=1):
+    """This machine's share of the categories.
+
+    The split is taken over the sorted list, so machines given the same
+    categories and shard count own disjoint sets whatever their priorities.
+    """
+    return [c for i, c in enumerate(sorted(set(categories))) if i % shard_count == shard_index]
+
+
+def category_stock(categories, coll=None):
+    """Wallpapers per category the bot hasn't used yet (not posted, skipped or failed)."""
+    coll = collection if coll is None else coll
+    stock = dict.fromkeys(categories, 0)
+    for row in coll.aggregate([
+        {"$match": {"category": {"$in": list(categories)}, "status": {"$nin": ["posted", "skipped", "failed"]}}},
+        {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+    ]):
+        stock[row["_id"]] = row["count"]
+    return stock
+
+
+def category_demand(categories):
+    """Posts per day drawn from each category; a group spreads its rate over its categories."""
+    demand = dict.fromkeys(categories, 0.0)
+    for cfg in BOT_GROUPS.values():
+        per_category = 86400 / cfg["interval_seconds"] / len(cfg["categories"])
+        for c in cfg["categories"]:
+            if c in demand:
+                demand[c] += per_category
+    return demand
+
+
+def prioritize(categories, priority="runway", coll=None):
+    """Order the shards so categories closest to running dry are crawled first.
+
+    "stock" sorts by unused wallpapers, "runway" by days of stock left at the
+    groups' posting rates (categories no group posts from go last) and "none"
+    keeps the given order.
+    """
+    if priority == "none":
+        return list(categories)
+    stock = category_stock(categories, coll)
+    if priority == "stock":
+        rank = stock
+    else:
+        demand = category_demand(categories)
+        rank = {c: stock[c] / demand[c] if demand[c] else float("inf") for c in categories}
+    ordered = sorted(categories, key=lambda c: rank[c])
+    print(f"Shard order by {priority}:")
+    for c in ordered:
+        runway = f", {rank[c]:.0f} days of runway" if priority == "runway" and rank[c] != float("inf") else ""
+        print(f"  {c}: {stock[c]} in stock{runway}")
+    return ordered
+
+
+def load_cursor(category, coll=None):
+    coll = state_collection if coll is None else coll
+    state = coll.find_one({"_id": category}) or {}
+    return state.get("page", 1)
+
+
+def save_cursor(category, page, finished=False, coll=None):
+    coll = state_collection if coll is None else coll
+    now = datetime.now(timezone.utc)
+    fields = {"page": page, "updated_at": now}
+    if finished:
+        fields["finished_at"] = now
+    coll.update_one({"_id": category}, {"$set": fields}, upsert=True)
+
+
+def crawl_shard(category, crawl_batch, fetch_listing, fetch_details, seen=None):
+    """Crawl one category listing.
+
+    Incremental shards read from page 1 down to their first fully known page.
+    Full shards resume from the page saved in crawl_state and, once several
+    batches bring nothing new, reset their cursor for the next full pass.
+    """
+    print(f"\n##### Shard {category} #####")
+    if seen is not None:
+        return crawl_incremental(fetch_listing, fetch_details, seen, category)
+    start_page = load_cursor(category)
+    if start_page > 1:
+        print(f"Resuming {category} at page {start_page}")
+    total_new = crawl(lambda pages: crawl_batch(pages, category), start_page, lambda page: save_cursor(category, page))
+    save_cursor(category, 1, finished=True)
+    return total_new
+
+
+def shard_counters():
+    return {
+        "listing": PAGES.value(kind="listing", result="ok"),
+        "detail": PAGES.value(kind="detail", result="ok"),
+        "inserted": INSERTED.value(),
+    }
+
+
+def init_shard_worker(cache):
+    global CACHE
+    if cache:
+        CACHE = HttpCache(cache)
+
+
+def run_shard(task):
+    """Crawl one (category, engine, incremental) shard; also the process-pool entry point."""
+    category, engine, incremental = task
+    before = shard_counters()
+    seen = load_seen_urls(category=category) if incremental else None
+    if engine == "async":
+        async_engine = AsyncEngine()
+        try:
+            crawl_shard(category, async_engine.crawl_batch, async_engine.fetch_listing, async_engine.fetch_details, seen)
+            retry_failed(async_engine.fetch_listing, async_engine.fetch_details, seen)
+        finally:
+            async_engine.close()
+    else:
+        crawl_shard(category, crawl_batch, fetch_listing, fetch_details, seen)
+        retry_failed(fetch_listing, fetch_details, seen)
+    after = shard_counters()
+    return {"category": category, **{key: after[key] - before[key] for key in after}}
+
+
+def crawl_shards(categories, engine="threads", incremental=False, workers=1, cache=None):
+    """Crawl each category shard, in order, on up to workers processes.
+
+    Workers are spawned rather than forked: the parent already holds a
+    MongoClient, a requests session and gate threads that must not be copied.
+    """
+    tasks = [(category, engine, incremental) for category in categories]
+    if workers <= 1 or len(tasks) <= 1:
+        results = [run_shard(task) for task in tasks]
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(min(workers, len(tasks)), initializer=init_shard_worker, initargs=(cache,)) as pool:
+            results = list(pool.imap_unordered(run_shard, tasks))
+        # Fold the workers' counters into this process for report_metrics.
+        for r in results:
+            PAGES.inc(r["listing"], kind="listing", result="ok")
+            PAGES.inc(r["detail"], kind="detail", result="ok")
+            INSERTED.inc(r["inserted"])
+    print("\n=== Shards ===")
+    for r in results:
+        print(f"  {r['category']}: {r['listing']} listing pages, {r['detail']} detail pages, {r['inserted']:g} new")
+    return results
+
+
+def report_metrics(started):
+    elapsed = time.monotonic() - started
+    pages = sum(PAGES.value(kind=kind, result="ok") for kind in ("listing", "detail"))
+    RUN_SECONDS.set(round(elapsed, 3))
+    PAGES_PER_SECOND.set(round(pages / elapsed, 2) if elapsed else 0)
+    print(f"Fetched {pages} pages in {elapsed:.1f}s ({PAGES_PER_SECOND.value():g} pages/s), "
+          f"inserted {INSERTED.value():g} wallpapers.")
+    if METRICS_FILE:
+        metrics.write_to_file(METRICS_FILE)
+        print(f"Metrics written to {METRICS_FILE}")
+
+
+def main(engine="threads", incremental=False, cache=None, categories=None, shard_index=0, shard_count=1,
+         workers=1, priority="runway"):
+    global CACHE
+    started = time.monotonic()
+    ensure_indexes()
+    if categories is not None:
+        shard = prioritize(select_shard(categories, shard_index, shard_count), priority)
+        print(f"Shard {shard_index + 1}/{shard_count}: crawling {len(shard)} categories.")
+        if cache:
+            CACHE = HttpCache(cache)
+        try:
+            crawl_shards(shard, engine, incremental, workers, cache)
+        finally:
+            if CACHE is not None:
+                CACHE.close()
+                CACHE = None
+        report_metrics(started)
+        return
+
+    seen = load_seen_urls() if incremental else None
+    if seen is not None:
+        print(f"Loaded {len(seen)} known wallpaper URLs.")
+    if cache:
+        CACHE = HttpCache(cache)
+        print(f"Using HTTP cache {cache} ({len(CACHE)} pages).")
+
+    try:
+        if engine == "async":
+            async_engine = AsyncEngine()
+            try:
+                if incremental:
+                    crawl_incremental(async_engine.fetch_listing, async_engine.fetch_details, seen)
+                else:
+                    crawl(async_engine.crawl_batch)
+                retry_failed(async_engine.fetch_listing, async_engine.fetch_details, seen)
+            finally:
+                async_engine.close()
+        else:
+            if incremental:
+                crawl_incremental(fetch_listing, fetch_details, seen)
+            else:
+                crawl(crawl_batch)
+            retry_failed(fetch_listing, fetch_details, seen)
+    finally:
+        if CACHE is not None:
+            CACHE.close()
+            CACHE = None
+    report_metrics(started)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Scrape 4kwallpapers.com into MongoDB.")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads",
+                        help="crawl with nested thread pools (default) or a single asyncio client")
+    parser.add_argument("--incremental", action="store_true",
+                        help="skip wallpapers already stored and stop at the first fully known listing page")
+    parser.add_argument("--cache", nargs="?", const=CACHE_PATH, default=os.getenv("SCRAPER_CACHE"), metavar="PATH",
+                        help=f"keep an on-disk HTTP cache (default file: {CACHE_PATH}; also set by SCRAPER_CACHE)")
+    parser.add_argument("--categories", metavar="LIST",
+                        help="crawl these category listings (comma-separated) instead of the global one; "
+                             "'groups' means every category in bot_config.BOT_GROUPS")
+    parser.add_argument("--shard-index", type=int, default=0,
+                        help="which share of the categories this machine crawls (0-based)")
+    parser.add_argument("--shard-count", type=int, default=1,
+                        help="how many machines split the categories between them")
+    parser.add_argument("--workers", type=int, default=1, help="category shards crawled in parallel processes")
+    parser.add_argument("--priority", choices=["runway", "stock", "none"], default="runway",
+                        help="crawl categories with the fewest days of stock (default), fewest unused "
+                             "wallpapers, or in the given order first")
+    args = parser.parse_args()
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be between 0 and --shard-count - 1")
+    categories = args.categories
+    if categories is None and args.shard_count > 1:
+        categories = "groups"
+    if categories is not None:
+        categories = group_categories() if categories == "groups" else [c.strip() for c in categories.split(",") if c.strip()]
+        if not categories:
+            parser.error("no categories to crawl (is bot_config.py present?)")
+    main(engine=args.engine, incremental=args.incremental, cache=args.cache, categories=categories,
+         shard_index=args.shard_index, shard_count=args.shard_count, workers=args.workers, priority=args.priority)
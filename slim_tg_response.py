@@ -0,0 +1,77 @@
+"""One-off migration: shrink stored tg_response dumps to the ids the bot keeps.
+
+Full Telethon ``Message.to_dict()`` dumps are replaced by
+``{"message_id", "chat_id", "media_id"}`` for both the preview and the HD
+message, the same shape bot.summarize_message writes for new posts.
+
+    python slim_tg_response.py --dry-run
+    python slim_tg_response.py
+"""
+import argparse
+import os
+from pymongo import MongoClient, UpdateOne
+
+DB_NAME = "prdp"
+COLLECTION_NAME = "wallpapers"
+BATCH_SIZE = 500
+
+MONGO_URI = os.getenv("FIREBASE_MONGO_URI", "mongodb://localhost:27017")
+
+
+def marked_chat_id(peer):
+    """Telethon-style marked id (-100… for channels) from a to_dict()'ed Peer."""
+    if not peer:
+        return None
+    kind = peer.get("_")
+    if kind == "PeerChannel":
+        return int(f"-100{peer['channel_id']}")
+    if kind == "PeerChat":
+        return -peer["chat_id"]
+    if kind == "PeerUser":
+        return peer["user_id"]
+    return None
+
+
+def slim_message(message):
+    if not isinstance(message, dict) or message.get("_") != "Message":
+        return message
+    media = message.get("media") or {}
+    media_obj = media.get("photo") or media.get("document") or {}
+    return {
+        "message_id": message.get("id"),
+        "chat_id": marked_chat_id(message.get("peer_id")),
+        "media_id": media_obj.get("id"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Slim stored tg_response documents.")
+    parser.add_argument("--dry-run", action="store_true", help="count affected documents without writing")
+    args = parser.parse_args()
+
+    collection = MongoClient(MONGO_URI)[DB_NAME][COLLECTION_NAME]
+    query = {"$or": [{"tg_response.preview._": "Message"}, {"tg_response.hd._": "Message"}]}
+    if args.dry_run:
+        print(f"Would slim {collection.count_documents(query)} documents.")
+        return
+
+    cursor = collection.find(query, {"tg_response": 1}).batch_size(BATCH_SIZE)
+    ops = []
+    total = 0
+    for doc in cursor:
+        tg = doc["tg_response"]
+        slim = {key: slim_message(value) for key, value in tg.items()}
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"tg_response": slim}}))
+        total += 1
+        if len(ops) >= BATCH_SIZE:
+            collection.bulk_write(ops, ordered=False)
+            ops = []
+            print(f"Slimmed {total} documents...")
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+
+    print(f"Slimmed {total} documents.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+
+import bot
+from phash_index import MultiIndexHashIndex, PackedHashArray, load_snapshot
+
+OWN = "f0f0f0f0f0f0f0f0"
+OTHER = "0123456789abcdef"
+
+
+class AsyncCollection:
+    def __init__(self, docs):
+        self.sync = mongomock.MongoClient().db.wallpapers
+        self.sync.insert_many(docs)
+
+    async def find_one(self, *args, **kwargs):
+        return self.sync.find_one(*args, **kwargs)
+
+    async def find(self, *args, **kwargs):
+        for doc in self.sync.find(*args, **kwargs):
+            yield doc
+
+
+@pytest.mark.parametrize("index_cls", [MultiIndexHashIndex, PackedHashArray])
+def test_exclude_leaves_out_one_copy(index_cls):
+    index = index_cls(bot.SIMILARITY_THRESHOLD - 1)
+    index.add_hex(OWN)
+    index.add_hex(OTHER)
+    own = int(OWN, 16)
+    assert index.find_within(own) == 0
+    assert index.find_within(own, exclude=own) is None
+    assert index.find_within(own ^ 0b11, exclude=own) is None
+    index.add_hex(OWN)  # a second wallpaper with the same picture
+    assert index.find_within(own, exclude=own) == 0
+
+
+@pytest.mark.parametrize("index_cls", [MultiIndexHashIndex, PackedHashArray])
+def test_changed_enriched_wallpaper_is_not_its_own_duplicate(monkeypatch, index_cls):
+    url = "https://example.com/images/wallpapers/a-3840x2160-1.jpg"
+    # enrich.py stored hashes for the wallpaper; the image has changed since.
+    monkeypatch.setattr(bot, "collection", AsyncCollection([
+        {"image_url": url, "status": "pending", "sha256": "old", "phash": OWN, "enriched_at": 1},
+    ]))
+    monkeypatch.setattr(bot, "STATUS_WRITER", None)
+    index = index_cls(bot.SIMILARITY_THRESHOLD - 1)
+    index.add_hex(OWN)
+    monkeypatch.setattr(bot, "PHASH_INDEX", index)
+
+    same_look = f"{int(OWN, 16) ^ 1:016x}"
+    status, _ = asyncio.run(bot.check_image_hashes_in_data("new", same_look, url, own_phash=OWN))
+    assert status == "proceed"
+    status, _ = asyncio.run(bot.check_image_hashes_in_data("new", OWN, url, own_phash=OWN))
+    assert status == "proceed"
+
+    # A different wallpaper with the same picture is still caught.
+    status, reasons = asyncio.run(bot.check_image_hashes_in_data("other", OWN, "https://example.com/b.jpg"))
+    assert (status, reasons["diff"]) == ("skipped", 0)
+
+
+def test_prefetched_candidate_is_discarded_when_vetting_fails(monkeypatch, tmp_path):
+    url = "https://example.com/images/wallpapers/c-3840x2160-3.jpg"
+    path = tmp_path / "candidate.jpg"
+    path.write_bytes(b"jpeg")
+
+    async def unreachable(*args):
+        raise ConnectionError("mongo is down")
+
+    async def take():
+        queue, slots = asyncio.Queue(), asyncio.Semaphore(1)
+        await slots.acquire()
+        queue.put_nowait({"jpg_url": url, "path": str(path), "sha256": "s", "phash": OWN,
+                          "own_phash": None, "vetted": False})
+        monkeypatch.setitem(bot.PREFETCH_QUEUES, -1, (queue, slots))
+        with pytest.raises(ConnectionError):
+            await bot.take_prefetched({"id": -1})
+
+    monkeypatch.setattr(bot, "check_image_hashes_in_data", unreachable)
+    bot.RESERVED_URLS.add(url)
+    asyncio.run(take())
+    assert not path.exists()
+    assert url not in bot.RESERVED_URLS
+
+
+@pytest.mark.parametrize("backend", ["numpy", "multi-index"])
+def test_snapshot_does_not_grow_across_restarts(monkeypatch, tmp_path, backend):
+    monkeypatch.setattr("image_hash.PHASH_BACKEND", backend)
+    monkeypatch.setattr(bot, "PHASH_SNAPSHOT", str(tmp_path / "phash.npy"))
+    for name in ("PHASH_INDEX", "PHASH_INDEX_AS_OF", "PHASH_REFRESHED"):
+        monkeypatch.setattr(bot, name, getattr(bot, name))
+    long_ago = datetime.now(timezone.utc) - timedelta(days=1)
+    collection = AsyncCollection([
+        {"image_url": "a", "phash": OWN, "updated_at": long_ago},
+        {"image_url": "b", "phash": OTHER, "updated_at": long_ago},
+    ])
+    monkeypatch.setattr(bot, "collection", collection)
+
+    for n, phash in enumerate(["00000000000000ff", "ffff000000000000"]):
+        asyncio.run(bot.load_phash_index())
+        # A post during the run: stored in Mongo and added to the index.
+        collection.sync.insert_one({"image_url": f"post{n}", "phash": phash, "updated_at": datetime.now(timezone.utc)})
+        bot.PHASH_INDEX.add_hex(phash)
+        bot.save_phash_snapshot()
+    asyncio.run(bot.load_phash_index())
+
+    assert len(bot.PHASH_INDEX) == 4
+    assert len(load_snapshot(bot.PHASH_SNAPSHOT)[0]) == 4
@@ -0,0 +1,72 @@
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+
+import bot
+
+CHUNK = bot.DOWNLOAD_CHUNK_SIZE
+ORIGINAL = b"a" * CHUNK + b"b" * CHUNK
+CHANGED = b"c" * CHUNK * 3
+
+
+class DroppedBody(httpx.AsyncByteStream):
+    """The first chunk of data, then a dropped connection."""
+
+    def __init__(self, data):
+        self.data = data
+
+    async def __aiter__(self):
+        yield self.data[:CHUNK]
+        raise httpx.ReadError("connection dropped")
+
+
+def site(changed, etag='"v1"', last_modified=None):
+    """A server whose first response drops; later ones honour Range + If-Range like a real one."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if len(requests) == 1:
+            headers = {"ETag": etag} if etag else {}
+            if last_modified:
+                headers["Last-Modified"] = last_modified
+            return httpx.Response(200, headers=headers, stream=DroppedBody(ORIGINAL))
+        if changed or "Range" not in request.headers:
+            return httpx.Response(200, content=CHANGED if changed else ORIGINAL)
+        start = int(request.headers["Range"][len("bytes="):-1])
+        return httpx.Response(206, content=ORIGINAL[start:])
+
+    return requests, handler
+
+
+def download(handler, tmp_path, monkeypatch):
+    sleep = asyncio.sleep
+    monkeypatch.setattr(bot.asyncio, "sleep", lambda _: sleep(0))
+    monkeypatch.setattr(bot, "HTTP_CLIENT", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return asyncio.run(bot.download_image("http://site/image.jpg", str(tmp_path / "image.jpg")))
+
+
+@pytest.mark.parametrize("changed", [False, True])
+def test_resume_sends_if_range(changed, tmp_path, monkeypatch):
+    requests, handler = site(changed)
+    path, sha256 = download(handler, tmp_path, monkeypatch)
+    expected = CHANGED if changed else ORIGINAL
+    assert requests[1].headers["Range"] == f"bytes={CHUNK}-"
+    assert requests[1].headers["If-Range"] == '"v1"'
+    assert sha256 == hashlib.sha256(expected).hexdigest()
+    assert (tmp_path / "image.jpg").read_bytes() == expected
+
+
+def test_weak_etag_falls_back_to_last_modified(tmp_path, monkeypatch):
+    requests, handler = site(False, etag='W/"v1"', last_modified="Wed, 01 Jan 2025 00:00:00 GMT")
+    download(handler, tmp_path, monkeypatch)
+    assert requests[1].headers["If-Range"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+def test_restarts_without_a_validator(tmp_path, monkeypatch):
+    requests, handler = site(False, etag=None)
+    path, sha256 = download(handler, tmp_path, monkeypatch)
+    assert "Range" not in requests[1].headers
+    assert sha256 == hashlib.sha256(ORIGINAL).hexdigest()
@@ -0,0 +1,65 @@
+"""parse_wallpaper_page against the parser it replaced, on saved detail pages.
+
+reference_page is the extraction scraper.py did before pages were parsed in a
+single fetch: BeautifulSoup for <meta name="keywords"> and get_highest_image's
+regex scan for the image.
+"""
+import re
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+
+import scraper
+
+PAGES = sorted((Path(__file__).parent / "fixtures" / "detail_pages").glob("*.html"))
+
+
+def reference_page(html):
+    soup = BeautifulSoup(html, "html.parser")
+    meta = soup.find("meta", {"name": "keywords"})
+    tags = scraper.sanitize_tags(meta["content"]) if meta else []
+
+    matches = re.findall(r'/images/wallpapers/[^"]+\.(?:jpe?g|png)', html, re.IGNORECASE)
+    best = None
+    best_pixels = 0
+    for u in [scraper.BASE_URL + m for m in matches]:
+        m = re.search(r'-(\d+)x(\d+)-\d+\.', u)
+        if m:
+            w, h = map(int, m.groups())
+            if w * h > best_pixels:
+                best_pixels = w * h
+                best = u
+    return tags, best
+
+
+def outcome(parse, html):
+    """(tags, image_url), or the exception type: the old scraper dropped a page that raised."""
+    try:
+        return parse(html)[:2]
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize("path", PAGES, ids=[p.stem for p in PAGES])
+def test_matches_old_parser(path):
+    html = path.read_text(encoding="utf-8")
+    expected = outcome(reference_page, html)
+    if isinstance(expected, tuple) and expected[1] is None:
+        expected = ([], None)  # no image: the page is dropped whatever its tags
+    assert outcome(scraper.parse_wallpaper_page, html) == expected
+
+
+def test_fixtures_cover_the_tricky_cases():
+    html = {p.stem: p.read_text(encoding="utf-8") for p in PAGES}
+    assert reference_page(html["entities"])[0] == ["Tom___Jerry", "Caf__Night", "_Neon__City", "Rock_n_Roll"]
+    assert reference_page(html["gt_in_content"])[0][0] == "Sunrise___Sunset"
+    assert reference_page(html["no_keywords"])[0] == []
+    assert outcome(reference_page, html["keywords_without_content"]) is KeyError
+
+
+def test_preview_is_the_smallest_variant():
+    html = (PAGES[0].parent / "plain.html").read_text(encoding="utf-8")
+    _, image_url, preview_url = scraper.parse_wallpaper_page(html)
+    assert image_url.endswith("-5120x2880-16432.jpg")
+    assert preview_url.endswith("-1280x720-16432.jpg")
@@ -0,0 +1,71 @@
+import asyncio
+from unittest.mock import AsyncMock, call
+
+import pytest
+from PIL import Image
+from telethon.errors import FloodWaitError
+
+import bot
+from ratelimit import UploadBudget
+
+
+class FloodingClient:
+    """Telegram stand-in whose HD sends hit FloodWait hd_floods times before going through."""
+
+    def __init__(self, hd_floods):
+        self.hd_floods = hd_floods
+        self.sent = []
+
+    async def upload_file(self, path):
+        return "uploaded"
+
+    async def send_file(self, chat_id, file, caption=None, force_document=False):
+        if force_document and self.hd_floods:
+            self.hd_floods -= 1
+            raise FloodWaitError(request=None, capture=0)
+        self.sent.append(caption)
+        return caption
+
+
+@pytest.mark.parametrize("fits", [True, False])
+def test_file_is_uploaded_once(tmp_path, monkeypatch, fits):
+    path = str(tmp_path / "wallpaper.jpg")
+    Image.new("RGB", (64, 36)).save(path)
+    monkeypatch.setattr(bot, "HD_SEND_DELAY", 0)
+    monkeypatch.setattr(bot, "fits_photo_limits", lambda _: fits)
+    client = AsyncMock()
+    client.upload_file.return_value = handle = object()
+
+    asyncio.run(bot.post_wallpaper(client, -100, path, "caption"))
+
+    client.upload_file.assert_awaited_once_with(path)
+    # A photo Telegram would reject gets its preview from the path (Telethon downscales it).
+    assert client.send_file.await_args_list == [
+        call(-100, handle if fits else path, caption="caption", force_document=False),
+        call(-100, handle, caption="HD Download", force_document=True),
+    ]
+
+
+def test_hd_send_waits_out_every_flood_wait(tmp_path, monkeypatch):
+    path = tmp_path / "wallpaper.jpg"
+    Image.new("RGB", (64, 36)).save(path)
+    monkeypatch.setattr(bot, "HD_SEND_DELAY", 0)
+    monkeypatch.setattr(bot, "UPLOAD_BUDGET", UploadBudget(1))
+    client = FloodingClient(hd_floods=3)
+
+    preview, hd = asyncio.run(bot.post_wallpaper(client, -100, str(path), "caption"))
+
+    assert (preview, hd) == ("caption", "HD Download")
+    assert client.sent == ["caption", "HD Download"]
+
+
+def test_flood_threshold_is_lowered_only_while_posting(monkeypatch):
+    monkeypatch.setattr(bot, "FLOOD_SLEEP_THRESHOLD", 5)
+    client = FloodingClient(hd_floods=0)
+    client.flood_sleep_threshold = 60
+
+    with bot.send_flood_threshold(client):
+        with bot.send_flood_threshold(client):  # a second group posting meanwhile
+            assert client.flood_sleep_threshold == 5
+        assert client.flood_sleep_threshold == 5
+    assert client.flood_sleep_threshold == 60
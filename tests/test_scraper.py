@@ -0,0 +1,106 @@
+import mongomock
+import pytest
+from pymongo import errors
+
+import scraper
+
+BASE = scraper.BASE_URL
+
+
+def wallpaper(href):
+    return {
+        "category": "nature",
+        "wallpaper_url": scraper.wallpaper_url_for(href),
+        "image_url": f"{BASE}/images/wallpapers{href[len('/nature'):-len('.html')]}-3840x2160-1.jpg",
+        "tags": ["nature"],
+    }
+
+
+@pytest.fixture
+def coll(monkeypatch):
+    coll = mongomock.MongoClient().db.wallpapers
+    coll.create_index("wallpaper_url", unique=True)
+    coll.create_index("image_url", unique=True)
+    monkeypatch.setattr(scraper, "collection", coll)
+    monkeypatch.setattr(scraper, "FAILED", {"listing": set(), "detail": set()})
+    return coll
+
+
+def test_incremental_crawl_retries_a_failed_detail_page(coll):
+    listing = {1: ["/nature/a.html", "/nature/b.html"]}
+    flaky = {"/nature/b.html"}
+
+    def fetch_listing(page, category=None):
+        return listing.get(page, [])
+
+    def fetch_details(hrefs):
+        results = []
+        for href in hrefs:
+            if href in flaky:
+                flaky.discard(href)  # fails once, then recovers
+                scraper.record_failure("detail", href)
+            else:
+                results.append(wallpaper(href))
+        return results
+
+    seen = scraper.load_seen_urls(coll)
+    assert scraper.crawl_incremental(fetch_listing, fetch_details, seen) == 1
+    assert scraper.retry_failed(fetch_listing, fetch_details, seen) == 1
+    assert coll.count_documents({}) == 2
+    assert not scraper.FAILED["detail"]
+
+
+def test_save_new_items_skips_repeats_and_stored_items(coll):
+    coll.insert_many([wallpaper("/nature/by-url.html"), wallpaper("/nature/by-image.html")])
+    # Same image under a new page URL: already stored by image_url.
+    moved = {**wallpaper("/nature/by-image.html"), "wallpaper_url": f"{BASE}/nature/moved.html"}
+    results = [
+        wallpaper("/nature/new.html"),
+        wallpaper("/nature/new.html"),  # repeated within the batch
+        wallpaper("/nature/by-url.html"),
+        moved,
+    ]
+
+    new_items = scraper.save_new_items(results, coll)
+
+    assert [item["wallpaper_url"] for item in new_items] == [f"{BASE}/nature/new.html"]
+    assert coll.count_documents({}) == 3
+    assert "rand" in coll.find_one({"wallpaper_url": f"{BASE}/nature/new.html"})
+
+
+class RacingCollection:
+    """Lets another writer store racer between save_new_items' lookup and its bulk_write."""
+
+    def __init__(self, coll, racer):
+        self.coll = coll
+        self.racer = racer
+
+    def find(self, *args, **kwargs):
+        return self.coll.find(*args, **kwargs)
+
+    def bulk_write(self, ops, ordered=True):
+        self.coll.insert_one(self.racer)
+        try:
+            return self.coll.bulk_write(ops, ordered=ordered)
+        except errors.BulkWriteError as e:
+            # mongomock numbers "upserted" by success; MongoDB reports each op's index.
+            failed = {err["index"] for err in e.details["writeErrors"]}
+            succeeded = [i for i in range(len(ops)) if i not in failed]
+            for upsert in e.details["upserted"]:
+                upsert["index"] = succeeded[upsert["index"]]
+            raise
+
+
+def test_save_new_items_keeps_upserts_when_another_writer_wins_a_key(coll, capsys):
+    racer = wallpaper("/nature/b.html")
+    results = [
+        wallpaper("/nature/a.html"),
+        {**racer, "wallpaper_url": f"{BASE}/nature/b-moved.html"},  # clashes on image_url
+        wallpaper("/nature/c.html"),
+    ]
+
+    new_items = scraper.save_new_items(results, RacingCollection(coll, racer))
+
+    assert [item["wallpaper_url"] for item in new_items] == [f"{BASE}/nature/a.html", f"{BASE}/nature/c.html"]
+    assert coll.count_documents({}) == 3
+    assert "2 inserted, 1 duplicate keys" in capsys.readouterr().out
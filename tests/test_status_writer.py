@@ -0,0 +1,33 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+
+import bot
+import wallpapers_io
+
+
+class AsyncCollection:
+    def __init__(self, docs):
+        self.sync = mongomock.MongoClient(tz_aware=True).db.wallpapers
+        self.sync.insert_many(docs)
+
+    async def bulk_write(self, ops, ordered=True):
+        return self.sync.bulk_write(ops, ordered=ordered)
+
+
+def test_flushed_update_is_seen_by_an_export_that_ran_while_it_was_queued(tmp_path):
+    coll = AsyncCollection([{"image_url": "a", "status": "pending"}])
+    writer = bot.StatusWriter(coll)
+    queued_at = datetime.now(timezone.utc) - timedelta(seconds=30)
+    checkpoint = tmp_path / "export.checkpoint.json"
+
+    async def run():
+        await writer.add("a", {"status": "posted", "updated_at": queued_at})
+        # An export runs while the update is still buffered.
+        wallpapers_io.export(coll.sync, str(tmp_path / "first.ndjson"), str(checkpoint))
+        await writer.flush()
+
+    asyncio.run(run())
+    assert wallpapers_io.export(coll.sync, str(tmp_path / "second.ndjson"), str(checkpoint)) == 1
+    assert '"posted"' in (tmp_path / "second.ndjson").read_text()
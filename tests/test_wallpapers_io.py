@@ -0,0 +1,39 @@
+import io
+
+import pytest
+
+import wallpapers_io
+from wallpapers_io import InvalidDocument, iter_documents
+
+DOC = '{"wallpaper_url": "w", "image_url": "i", "category": "c"}'
+
+
+def read(text, chunk=4):
+    wallpapers_io.READ_CHUNK_SIZE, saved = chunk, wallpapers_io.READ_CHUNK_SIZE
+    try:
+        return [doc for _, doc in iter_documents(io.StringIO(text))]
+    finally:
+        wallpapers_io.READ_CHUNK_SIZE = saved
+
+
+@pytest.mark.parametrize("text, count", [
+    (f"[{DOC},{DOC}]", 2),
+    (f" [\n  {DOC} ,\n  {DOC}\n]\n", 2),
+    ("[]", 0),
+    (f"{DOC}\n{DOC}\n", 2),
+])
+def test_valid_files(text, count):
+    assert len(read(text)) == count
+
+
+@pytest.mark.parametrize("text", [
+    f"[{DOC},,,{DOC}]",
+    f"[{DOC} {DOC}]",
+    f"[{DOC},]",
+    f"[{DOC}] trailing garbage",
+    f"[{DOC}",
+    "[1, 2]",
+])
+def test_arrays_mongoimport_rejects(text):
+    with pytest.raises(InvalidDocument):
+        read(text)
@@ -0,0 +1,305 @@
+"""Streaming export / import of the wallpapers collection as NDJSON.
+
+One MongoDB Extended JSON document per line (ObjectIds and dates survive the
+round trip), optionally gzip- or zstd-compressed by file extension. Documents
+are read and written one at a time in batches, so memory stays flat however
+big the collection is.
+
+    python wallpapers_io.py export wallpapers.ndjson.gz
+    python wallpapers_io.py export changes.ndjson.zst --checkpoint export.checkpoint.json
+    python wallpapers_io.py validate wallpapers.json
+    python wallpapers_io.py import wallpapers.ndjson.gz
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from functools import partial
+
+from bson import json_util
+from pymongo import InsertOne, MongoClient, ReplaceOne, errors
+
+DB_NAME = "prdp"
+COLLECTION_NAME = "wallpapers"
+BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+MAX_DOCUMENT_CHARS = 16 * 1024 * 1024  # MongoDB's own document size limit
+REQUIRED_FIELDS = ("wallpaper_url", "image_url", "category")
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+
+MONGO_URI = os.getenv("FIREBASE_MONGO_URI", "mongodb://localhost:27017")
+
+
+class InvalidDocument(ValueError):
+    def __init__(self, position, message):
+        super().__init__(f"{position}: {message}")
+        self.position = position
+
+
+# --- Files ---
+def open_text(path, mode):
+    """Open path for streaming text in mode "r" or "w", (de)compressing by extension ("-" is stdin/stdout)."""
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise SystemExit("zstd files need the zstandard package: pip install zstandard")
+        raw = open(path, mode + "b")
+        if mode == "r":
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+# --- Reading ---
+def iter_documents(f):
+    """Yield (position, document) from NDJSON or a JSON array, without loading the whole file.
+
+    NDJSON is decoded line by line. A top-level JSON array is decoded one
+    element at a time from a sliding buffer. Anything else raises InvalidDocument.
+    """
+    decoder = json.JSONDecoder(object_hook=partial(json_util.object_hook, json_options=JSON_OPTIONS))
+    first = ""
+    while not first:
+        chunk = f.read(1)
+        if not chunk:
+            return
+        first = chunk.strip()
+    if first == "[":
+        yield from _iter_array(f, decoder)
+    elif first == "{":
+        yield from _iter_lines(first + f.readline(), f, decoder)
+    else:
+        raise InvalidDocument("byte 1", f"expected '[' or '{{', found {first!r}")
+
+
+def _iter_lines(first_line, f, decoder):
+    for number, line in enumerate(_chain_line(first_line, f), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            doc = decoder.decode(line)
+        except json.JSONDecodeError as e:
+            raise InvalidDocument(f"line {number}", f"not one JSON document per line ({e.msg})")
+        yield f"line {number}", doc
+
+
+def _chain_line(first_line, f):
+    yield first_line
+    yield from f
+
+
+def _iter_array(f, decoder):
+    """Yield the elements of a JSON array whose '[' has been read, as mongoimport --jsonArray would.
+
+    Elements must be objects separated by exactly one comma, and nothing but
+    whitespace may follow the closing ']'.
+    """
+    buf = ""
+    pos = 0
+    eof = False
+
+    def peek():
+        """Skip whitespace and return the next character (None at the end of the file)."""
+        nonlocal buf, pos, eof
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if eof:
+                return None
+            buf, pos = f.read(READ_CHUNK_SIZE), 0
+            eof = not buf
+
+    index = 0
+    if peek() == "]":
+        pos += 1
+    else:
+        while True:
+            char = peek()
+            if char != "{":
+                found = "end of file" if char is None else repr(char)
+                raise InvalidDocument(f"element {index + 1}", f"expected an object, found {found}")
+            while True:
+                try:
+                    doc, end = decoder.raw_decode(buf, pos)
+                    break
+                except json.JSONDecodeError as e:
+                    if eof or len(buf) - pos > MAX_DOCUMENT_CHARS:
+                        raise InvalidDocument(f"element {index + 1}", e.msg)
+                    # The element runs past the buffer: keep its start and read more.
+                    more = f.read(READ_CHUNK_SIZE)
+                    eof = not more
+                    buf, pos = buf[pos:] + more, 0
+            index += 1
+            yield f"element {index}", doc
+            pos = end
+            char = peek()
+            if char == "]":
+                pos += 1
+                break
+            if char != ",":
+                found = "end of file" if char is None else repr(char)
+                raise InvalidDocument(f"element {index}", f"expected ',' or ']' after it, found {found}")
+            pos += 1
+    char = peek()
+    if char is not None:
+        raise InvalidDocument(f"element {index}", f"unexpected {char!r} after the closing ']'")
+
+
+def check_document(position, doc):
+    if not isinstance(doc, dict):
+        raise InvalidDocument(position, "not a JSON object")
+    missing = [field for field in REQUIRED_FIELDS if not isinstance(doc.get(field), str)]
+    if missing:
+        raise InvalidDocument(position, f"missing or non-string {', '.join(missing)}")
+
+
+def validate(path, max_errors=20):
+    """Check every document in path; return (documents, errors)."""
+    count = 0
+    problems = []
+    with open_text(path, "r") as f:
+        try:
+            for position, doc in iter_documents(f):
+                count += 1
+                try:
+                    check_document(position, doc)
+                except InvalidDocument as e:
+                    problems.append(str(e))
+                    if len(problems) >= max_errors:
+                        break
+        except InvalidDocument as e:
+            problems.append(str(e))
+    return count, problems
+
+
+# --- Export ---
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json_util.loads(f.read(), json_options=JSON_OPTIONS)
+
+
+def save_checkpoint(path, checkpoint):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(json_util.dumps(checkpoint, json_options=JSON_OPTIONS))
+    os.replace(tmp, path)
+
+
+def export_query(checkpoint):
+    """Everything, or only what was inserted or updated since the checkpoint."""
+    if not checkpoint:
+        return {}
+    return {"$or": [{"_id": {"$gt": checkpoint["last_id"]}}, {"updated_at": {"$gte": checkpoint["exported_at"]}}]}
+
+
+def export(coll, path, checkpoint_path=None, batch_size=BATCH_SIZE):
+    """Stream the collection (or the changes since the checkpoint) to path; return the document count."""
+    checkpoint = load_checkpoint(checkpoint_path)
+    # Taken before the query starts, so updates racing the export are picked up next time.
+    started_at = datetime.now(timezone.utc)
+    last_id = checkpoint["last_id"] if checkpoint else None
+    count = 0
+    tmp = path if path == "-" else f"{path}.tmp{os.path.splitext(path)[1]}"
+    with open_text(tmp, "w") as f:
+        for doc in coll.find(export_query(checkpoint)).sort("_id", 1).batch_size(batch_size):
+            f.write(json_util.dumps(doc, json_options=JSON_OPTIONS))
+            f.write("\n")
+            if last_id is None or doc["_id"] > last_id:
+                last_id = doc["_id"]
+            count += 1
+            if count % 10000 == 0:
+                print(f"Exported {count} documents...", file=sys.stderr)
+    if tmp != path:
+        os.replace(tmp, path)
+    if checkpoint_path and last_id is not None:
+        save_checkpoint(checkpoint_path, {"last_id": last_id, "exported_at": started_at})
+    return count
+
+
+# --- Import ---
+def import_documents(coll, path, batch_size=BATCH_SIZE):
+    """Validate and bulk-write every document in path; return (written, duplicates).
+
+    Documents with an _id replace the stored copy (so incremental exports
+    apply cleanly); the rest are inserted. Unique-key clashes are counted.
+    """
+    written = duplicates = 0
+    ops = []
+
+    def flush():
+        nonlocal written, duplicates
+        try:
+            result = coll.bulk_write(ops, ordered=False)
+            written += result.inserted_count + result.upserted_count + result.matched_count
+        except errors.BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in write_errors):
+                raise
+            duplicates += len(write_errors)
+            written += e.details.get("nInserted", 0) + e.details.get("nUpserted", 0) + e.details.get("nMatched", 0)
+        ops.clear()
+
+    with open_text(path, "r") as f:
+        for position, doc in iter_documents(f):
+            check_document(position, doc)
+            ops.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) if "_id" in doc else InsertOne(doc))
+            if len(ops) >= batch_size:
+                flush()
+                print(f"Imported {written} documents...", file=sys.stderr)
+        if ops:
+            flush()
+    return written, duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream the wallpapers collection to and from NDJSON files.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="write the collection as NDJSON (.gz/.zst to compress)")
+    exp.add_argument("path")
+    exp.add_argument("--checkpoint", metavar="FILE",
+                     help="only export documents inserted or updated since this checkpoint, then advance it")
+    exp.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    imp = sub.add_parser("import", help="validate and bulk-write an NDJSON or JSON array file")
+    imp.add_argument("path")
+    imp.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    val = sub.add_parser("validate", help="check a file without touching MongoDB")
+    val.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "validate":
+        count, problems = validate(args.path)
+        for problem in problems:
+            print(f"❌ {problem}")
+        print(f"{'❌' if problems else '✅'} {count} documents checked, {len(problems)} problems")
+        sys.exit(1 if problems else 0)
+
+    collection = MongoClient(MONGO_URI)[DB_NAME][COLLECTION_NAME]
+    if args.command == "export":
+        count = export(collection, args.path, args.checkpoint, args.batch_size)
+        print(f"Exported {count} documents to {args.path}", file=sys.stderr)
+    else:
+        try:
+            written, duplicates = import_documents(collection, args.path, args.batch_size)
+        except InvalidDocument as e:
+            raise SystemExit(f"❌ {e} (nothing after it was imported)")
+        print(f"Imported {written} documents, {duplicates} duplicate keys skipped.")
+
+
+if __name__ == "__main__":
+    main()